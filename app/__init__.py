@@ -1,11 +1,19 @@
 from flask import Flask
 from app.config import Config
+from app.utils import configure_logging
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from app.replicas import RoutingSession, replica_router
 
 app = Flask(__name__)
 app.config.from_object(Config)
-db = SQLAlchemy(app)
+configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT, Config.LOG_QUEUE_SIZE, Config.LOG_SAMPLE_RATES)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 migrate = Migrate(app, db)
 
+with app.app_context():
+    replica_router.configure(
+        {key: db.engines[key] for key in Config.SQLALCHEMY_BINDS},
+        Config.REPLICA_STRATEGY)
+
 from app import routes, models
@@ -0,0 +1,193 @@
+"""
+Body codecs and Accept/Content-Type negotiation
+"""
+import json
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import msgpack
+from flask import Response, g, request
+
+DEFAULT_MEDIA_TYPE = 'application/json'
+
+# Outside a string only quotes and structural characters matter
+_JSON_STRUCTURE = re.compile(rb'["\[\]{}:]')
+# Rest of a string after its opening quote, up to and including the closing
+# one; unrolled so each byte is consumed exactly one way
+_JSON_STRING_TAIL = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+
+class PayloadTooComplex(ValueError):
+    """Raised when a request body exceeds the nesting or key limits"""
+
+
+def check_json_limits(body: bytes, max_depth: int, max_keys: int) -> None:
+    """Check nesting depth and key count of a raw JSON body without parsing it.
+
+    One forward pass: outside strings it jumps to the next quote or
+    structural character, inside one to the closing quote, skipping
+    escapes. Every byte is looked at once, so hostile bodies cost linear
+    time. An unterminated string raises ValueError.
+    """
+    depth = 0
+    keys = 0
+    position = 0
+    while True:
+        match = _JSON_STRUCTURE.search(body, position)
+        if match is None:
+            return
+        token = body[match.start():match.end()]
+        position = match.end()
+        if token == b'"':
+            string = _JSON_STRING_TAIL.match(body, position)
+            if string is None:
+                raise ValueError("Unterminated string in payload")
+            position = string.end()
+        elif token in (b'{', b'['):
+            depth += 1
+            if depth > max_depth:
+                raise PayloadTooComplex(f"Payload nesting exceeds {max_depth} levels")
+        elif token in (b'}', b']'):
+            depth -= 1
+        else:
+            keys += 1
+            if keys > max_keys:
+                raise PayloadTooComplex(f"Payload has more than {max_keys} keys")
+
+
+def check_object_limits(data: Any, max_depth: int, max_keys: int) -> None:
+    """Check nesting depth and key count of an already decoded payload"""
+    keys = 0
+    stack = [(data, 1)]
+    while stack:
+        value, depth = stack.pop()
+        if isinstance(value, dict):
+            children = value.values()
+            keys += len(value)
+            if keys > max_keys:
+                raise PayloadTooComplex(f"Payload has more than {max_keys} keys")
+        elif isinstance(value, list):
+            children = value
+        else:
+            continue
+        if depth > max_depth:
+            raise PayloadTooComplex(f"Payload nesting exceeds {max_depth} levels")
+        stack.extend((child, depth + 1) for child in children)
+
+
+_PLAIN_SCALARS = (str, int, float, bool, type(None))
+
+
+def _check_plain(data: Any) -> None:
+    """Reject values JSON could not carry: bytes, extension types, non-string keys"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if not all(isinstance(key, str) for key in value):
+                raise ValueError("Map keys must be strings")
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif not isinstance(value, _PLAIN_SCALARS):
+            raise ValueError(f"Unsupported value of type {type(value).__name__}")
+
+
+def _reject_ext(code: int, data: bytes) -> Any:
+    raise ValueError(f"Unsupported extension type {code}")
+
+
+class Codec(ABC):
+    """Encodes response bodies and decodes request bodies for one media type.
+
+    ``decode`` raises PayloadTooComplex when the body exceeds the depth or key
+    limits, and ValueError when it is malformed.
+    """
+
+    media_type: str = ''
+
+    @abstractmethod
+    def encode(self, data: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, body: bytes, max_depth: Optional[int] = None,
+               max_keys: Optional[int] = None) -> Any:
+        ...
+
+
+class JsonCodec(Codec):
+    media_type = 'application/json'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators=(',', ':'), default=str)
+
+    def encode(self, data: Any) -> bytes:
+        return self._encoder.encode(data).encode()
+
+    def decode(self, body, max_depth=None, max_keys=None):
+        # the token scan runs before parsing, so hostile bodies are never built
+        if max_depth is not None and max_keys is not None:
+            check_json_limits(body, max_depth, max_keys)
+        return json.loads(body)
+
+
+class MessagePackCodec(Codec):
+    media_type = 'application/msgpack'
+
+    def encode(self, data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True, default=str)
+
+    def decode(self, body, max_depth=None, max_keys=None):
+        try:
+            # the unpacker bounds each container by the body size on its own
+            data = msgpack.unpackb(body, raw=False, strict_map_key=True, ext_hook=_reject_ext)
+        except (msgpack.UnpackException, msgpack.ExtraData, ValueError) as e:
+            raise ValueError(str(e)) from e
+        # bin values and timestamps bypass the hooks; the rest of the app expects JSON types
+        _check_plain(data)
+        if max_depth is not None and max_keys is not None:
+            check_object_limits(data, max_depth, max_keys)
+        return data
+
+
+CODECS: Dict[str, Codec] = {}
+
+
+def register_codec(codec: Codec) -> None:
+    """Make ``codec`` available for negotiation under its media type"""
+    CODECS[codec.media_type] = codec
+
+
+register_codec(JsonCodec())
+register_codec(MessagePackCodec())
+
+
+def supported_media_types() -> List[str]:
+    return list(CODECS)
+
+
+def response_codec() -> Codec:
+    """Codec for the best match of the request's Accept header; JSON by default"""
+    media_type = request.accept_mimetypes.best_match(list(CODECS), default=DEFAULT_MEDIA_TYPE)
+    return CODECS.get(media_type, CODECS[DEFAULT_MEDIA_TYPE])
+
+
+def request_codec() -> Optional[Codec]:
+    """Codec for the request's Content-Type, or None if unsupported"""
+    return CODECS.get(request.mimetype)
+
+
+def request_payload() -> Any:
+    """The request body as decoded by ``schemas.validate_json``"""
+    return g.get('payload')
+
+
+def respond(data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Encode ``data`` with the negotiated codec"""
+    codec = response_codec()
+    response = Response(codec.encode(data), status=status, mimetype=codec.media_type,
+                        headers=headers)
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,149 @@
+"""
+Concurrency helpers shared by the services and routes
+"""
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised when a duplicate caller gives up waiting for the leader"""
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key.
+
+    The first caller for a key (the leader) runs the function. Callers that
+    arrive while it runs wait for it and get the same result, or the same
+    exception. Nothing is cached after the call finishes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], args: tuple = (),
+           kwargs: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        """Run ``fn(*args, **kwargs)`` once per concurrent group of ``key`` callers.
+
+        ``timeout`` bounds how long a duplicate waits; the leader is never
+        interrupted.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn(*args, **(kwargs or {}))
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(timeout):
+            raise SingleFlightTimeout(f"Timed out waiting for in-flight call {key!r}")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        """Number of keys currently being computed"""
+        return len(self._calls)
+
+
+def single_flight(key: Optional[Callable[..., Hashable]] = None, timeout: Optional[float] = None):
+    """Decorator coalescing concurrent calls of a function or service method.
+
+    ``key`` receives the call's arguments (including ``self`` for methods)
+    and returns the coalescing key; by default the arguments themselves,
+    which must then be hashable.
+    """
+    def decorator(fn):
+        group = SingleFlight()
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            call_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return group.do(call_key, fn, args, kwargs, timeout=timeout)
+
+        wrapper.single_flight = group
+        return wrapper
+    return decorator
+
+
+class ConcurrencyLimiter:
+    """Bounded concurrency with a bounded wait queue.
+
+    Up to ``max_concurrent`` callers hold a slot at once and up to
+    ``max_queue`` more wait for one. Callers beyond that, or whose wait
+    outlives their timeout, are rejected straight away so the caller can
+    shed load instead of letting latency grow.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int):
+        if max_concurrent < 1 or max_queue < 0:
+            raise ValueError("max_concurrent must be >= 1 and max_queue >= 0")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take a slot, waiting at most ``timeout`` seconds; False if rejected"""
+        with self._condition:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                return True
+            if self.waiting >= self.max_queue or (timeout is not None and timeout <= 0):
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            try:
+                if not self._condition.wait_for(lambda: self.active < self.max_concurrent, timeout):
+                    self.timed_out += 1
+                    return False
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self) -> None:
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def saturated(self) -> bool:
+        """Whether new callers would be rejected right now"""
+        return self.active >= self.max_concurrent and self.waiting >= self.max_queue
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out
+        }
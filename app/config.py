@@ -10,6 +10,11 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Read replicas: comma-separated URIs, registered as binds replica_0..N
+    REPLICA_DATABASE_URLS = [url for url in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if url]
+    REPLICA_STRATEGY = os.environ.get('REPLICA_STRATEGY', 'round_robin')
+    SQLALCHEMY_BINDS = {f'replica_{index}': url for index, url in enumerate(REPLICA_DATABASE_URLS)}
+    
     # SonarCloud integration settings
     SONAR_PROJECT_KEY = os.environ.get('SONAR_PROJECT_KEY', 'third-party-integration-demo')
     SONAR_ORGANIZATION = os.environ.get('SONAR_ORGANIZATION', 'mrszew')
@@ -19,9 +24,52 @@ class Config:
     API_TITLE = 'Third Party Integration Demo API'
     API_DESCRIPTION = 'Demo API for testing SonarCloud integration'
     
+    # 0-255, distinct per host; keeps user IDs from different hosts apart
+    WORKER_ID = int(os.environ['WORKER_ID']) if os.environ.get('WORKER_ID') else None
+    
+    # User storage: comma-separated SQLite shard files; empty keeps users in memory
+    USER_STORE_SHARDS = [path for path in os.environ.get('USER_STORE_SHARDS', '').split(',') if path]
+    # Shared ring membership; defaults to ring.db next to the first shard
+    USER_STORE_RING = os.environ.get('USER_STORE_RING') or None
+    
+    # Request payload limits, enforced before JSON parsing
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', str(1024 * 1024)))
+    JSON_MAX_DEPTH = int(os.environ.get('JSON_MAX_DEPTH', '32'))
+    JSON_MAX_KEYS = int(os.environ.get('JSON_MAX_KEYS', '10000'))
+    
+    # Admission control: requests beyond MAX_CONCURRENCY wait in a queue of
+    # MAX_QUEUE; the rest, or any still waiting at their deadline, get a 503
+    ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '64'))
+    ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '128'))
+    # seconds from arrival (X-Request-Start when a router sets it) to give up
+    REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', '10'))
+    RETRY_AFTER = int(os.environ.get('RETRY_AFTER', '1'))
+    READINESS_DB_TTL = float(os.environ.get('READINESS_DB_TTL', '5'))
+    
+    # Background jobs for POST /api/v1/process?async=1: 'thread' or 'process' pool
+    JOB_EXECUTOR = os.environ.get('JOB_EXECUTOR', 'thread')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+    JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', '100'))
+    JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', '300'))
+    JOB_MAX_RESULTS = int(os.environ.get('JOB_MAX_RESULTS', '1000'))
+    
+    # Counters kept for the most frequent payload fields and values
+    PAYLOAD_STATS_TOP_K = int(os.environ.get('PAYLOAD_STATS_TOP_K', '64'))
+    # SQLite file the workers share their payload statistics through; unset keeps them per worker
+    PAYLOAD_STATS_FILE = os.environ.get('PAYLOAD_STATS_FILE') or None
+    
     # Logging configuration
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
-    LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    # 'json' for structured output, otherwise a logging.Formatter format string
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+    # per-operation sampling for log_operation, e.g. "process_data=0.1,user_created=1"
+    LOG_SAMPLE_RATES = {
+        operation.strip(): float(rate)
+        for operation, rate in (
+            item.split('=', 1) for item in os.environ.get('LOG_SAMPLE_RATES', '').split(',') if '=' in item
+        )
+    }
     
     # Security settings
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
@@ -0,0 +1,170 @@
+"""
+In-process background jobs with polled, expiring results
+"""
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+EXECUTORS = ('thread', 'process')
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when a job is submitted while ``max_pending`` jobs are unfinished"""
+
+
+class Job:
+    __slots__ = ('job_id', 'status', 'submitted_at', 'finished_at', 'result', 'error')
+
+    def __init__(self, job_id: str, submitted_at: float):
+        self.job_id = job_id
+        self.status = 'queued'
+        self.submitted_at = submitted_at
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        job = {'id': self.job_id, 'status': self.status}
+        if self.finished_at is not None:
+            job['latency_ms'] = round((self.finished_at - self.submitted_at) * 1000, 2)
+        if self.status == 'done':
+            job['result'] = self.result
+        elif self.status == 'failed':
+            job['error'] = self.error
+        return job
+
+
+class JobQueue:
+    """Runs jobs on a dedicated thread or process pool, apart from request threads.
+
+    At most ``max_pending`` jobs are queued or running; submissions beyond that
+    raise JobQueueFull. Finished jobs stay pollable for ``result_ttl`` seconds;
+    beyond ``max_results`` finished jobs the oldest are dropped early. Job ids
+    are random, so one client cannot guess another's. Jobs live in the
+    process that accepted them, so polls must reach that same process.
+    ``listener`` is called as ``listener(event, latency)`` with ``event`` one
+    of submitted, rejected, done or failed; latency (seconds from submission)
+    is only given for finished jobs. In process mode the function and its
+    arguments must be picklable.
+    """
+
+    def __init__(self, executor: str = 'thread', workers: int = 2, max_pending: int = 100,
+                 result_ttl: float = 300.0, max_results: int = 1000,
+                 listener: Optional[Callable[[str, Optional[float]], None]] = None):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown job executor {executor!r}")
+        self.executor_kind = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.listener = listener
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+        self._jobs: Dict[str, Job] = {}
+        # finished jobs in completion order, so expiry only looks at the front
+        self._expiry: Deque[Tuple[float, str]] = deque()
+        self._lock = threading.Lock()
+
+    def _pool(self) -> Executor:
+        # created on first use so importing the app starts no workers
+        if self._executor is None:
+            if self.executor_kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='job')
+        return self._executor
+
+    def submit(self, fn: Callable[..., Any], *args: Any,
+               on_result: Optional[Callable[[Any], None]] = None) -> str:
+        """Queue ``fn(*args)`` and return the job id to poll.
+
+        ``on_result`` is called with the result of a successful job in this
+        process, also when the job itself ran in a worker process.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if self.pending >= self.max_pending:
+                rejected = True
+            else:
+                rejected = False
+                self.pending += 1
+                job = Job(secrets.token_urlsafe(16), now)
+                self._jobs[job.job_id] = job
+                pool = self._pool()
+        if rejected:
+            self._notify('rejected')
+            raise JobQueueFull(f"{self.max_pending} jobs already pending")
+
+        self._notify('submitted')
+        try:
+            if self.executor_kind == 'thread':
+                future = pool.submit(self._run, job, fn, args)
+            else:
+                # a process pool cannot report when a worker picks the job up
+                future = pool.submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+                del self._jobs[job.job_id]
+            raise
+        future.add_done_callback(lambda done: self._finish(job, done, on_result))
+        return job.job_id
+
+    @staticmethod
+    def _run(job: Job, fn: Callable[..., Any], args: tuple) -> Any:
+        job.status = 'running'
+        return fn(*args)
+
+    def _finish(self, job: Job, future: Future,
+                on_result: Optional[Callable[[Any], None]]) -> None:
+        now = time.monotonic()
+        error = future.exception()
+        if error is None and on_result is not None:
+            try:
+                on_result(future.result())
+            except Exception as e:
+                error = e
+        with self._lock:
+            job.finished_at = now
+            if error is None:
+                job.status = 'done'
+                job.result = future.result()
+            else:
+                job.status = 'failed'
+                job.error = f"{type(error).__name__}: {error}"
+            self.pending -= 1
+            self._expiry.append((now + self.result_ttl, job.job_id))
+            while len(self._expiry) > self.max_results:
+                self._jobs.pop(self._expiry.popleft()[1], None)
+        self._notify(job.status, now - job.submitted_at)
+
+    def _notify(self, event: str, latency: Optional[float] = None) -> None:
+        if self.listener is not None:
+            self.listener(event, latency)
+
+    def _expire(self, now: float) -> None:
+        while self._expiry and self._expiry[0][0] <= now:
+            _, job_id = self._expiry.popleft()
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status, with the result once done; None if unknown or expired"""
+        with self._lock:
+            self._expire(time.monotonic())
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def depth(self) -> int:
+        """Jobs queued or running"""
+        return self.pending
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
@@ -1,3 +1,5 @@
+from sqlalchemy import DDL, event
+
 from app import db
 
 class Menu(db.Model):
@@ -6,3 +8,34 @@ class Menu(db.Model):
 
     def __repr__(self):
         return '<Menu {}>'.format(self.name)
+
+
+# Full-text index over Menu.name. On SQLite this is an external-content FTS5
+# table kept in sync by triggers; the same objects are created by the
+# b1f4c2d9e7a3 migration, these listeners cover db.create_all().
+MENU_FTS_SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS menu_fts USING fts5("
+    "name, content='menu', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS menu_fts_ai AFTER INSERT ON menu BEGIN "
+    "INSERT INTO menu_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS menu_fts_ad AFTER DELETE ON menu BEGIN "
+    "INSERT INTO menu_fts(menu_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS menu_fts_au AFTER UPDATE ON menu BEGIN "
+    "INSERT INTO menu_fts(menu_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO menu_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+MENU_FTS_SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS menu_fts_au",
+    "DROP TRIGGER IF EXISTS menu_fts_ad",
+    "DROP TRIGGER IF EXISTS menu_fts_ai",
+    "DROP TABLE IF EXISTS menu_fts",
+]
+
+for statement in MENU_FTS_SQLITE_CREATE:
+    event.listen(Menu.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in MENU_FTS_SQLITE_DROP:
+    event.listen(Menu.__table__, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(
+    Menu.__table__, 'after_create',
+    DDL("CREATE INDEX IF NOT EXISTS ix_menu_name_fts ON menu "
+        "USING gin (to_tsvector('simple', coalesce(name, '')))").execute_if(dialect='postgresql'))
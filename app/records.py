@@ -0,0 +1,113 @@
+"""
+Compact in-memory record representations
+"""
+import json
+import struct
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from app.utils import IdGenerator
+
+# updated_at ms (0 = never), status code, username length, email length;
+# followed by username, email and optional JSON for any extra fields. The ID
+# is the store key and already encodes created_at (see IdGenerator), so
+# neither is repeated in the record.
+_HEADER = struct.Struct('>qBHH')
+
+# fixed, so clients cannot grow the table; append only, codes are persisted
+USER_STATUSES = ('active', 'inactive', 'suspended', 'deleted')
+_status_codes: Dict[str, int] = {name: code for code, name in enumerate(USER_STATUSES)}
+
+
+def status_code(status: str) -> int:
+    """One-byte code for a status string; ValueError for unknown statuses"""
+    try:
+        return _status_codes[status]
+    except KeyError:
+        raise ValueError(f"Unknown user status {status!r}") from None
+
+
+def _iso(millis: int) -> str:
+    return datetime.fromtimestamp(millis / 1000).isoformat()
+
+
+def pack_user(username: str, email: str, updated_at: Optional[int] = None,
+              status: str = 'active', extra: Optional[Dict[str, Any]] = None) -> bytes:
+    """Pack a user into one immutable bytes object (updated_at in epoch ms)"""
+    username_raw = username.encode()
+    email_raw = email.encode()
+    header = _HEADER.pack(updated_at or 0, status_code(status),
+                          len(username_raw), len(email_raw))
+    tail = json.dumps(extra).encode() if extra else b''
+    return header + username_raw + email_raw + tail
+
+
+class UserRecord(Mapping):
+    """Read-only dict-like view over a packed user; fields decode on access"""
+
+    __slots__ = ('user_id', 'data')
+
+    def __init__(self, user_id: int, data: bytes):
+        self.user_id = user_id
+        self.data = data
+
+    def _header(self):
+        return _HEADER.unpack_from(self.data)
+
+    @property
+    def created_at_ms(self) -> int:
+        return IdGenerator.millis_of(self.user_id)
+
+    @property
+    def updated_at_ms(self) -> Optional[int]:
+        return self._header()[0] or None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Decode every field into a plain dict for the JSON boundary"""
+        updated_at, status, username_len, email_len = self._header()
+        offset = _HEADER.size
+        data = self.data
+        user = {
+            'id': IdGenerator.format(self.user_id),
+            'username': data[offset:offset + username_len].decode(),
+            'email': data[offset + username_len:offset + username_len + email_len].decode(),
+            'created_at': _iso(self.created_at_ms),
+            'status': USER_STATUSES[status]
+        }
+        if updated_at:
+            user['updated_at'] = _iso(updated_at)
+        tail = data[offset + username_len + email_len:]
+        if tail:
+            user.update(json.loads(tail))
+        return user
+
+    def extra(self) -> Dict[str, Any]:
+        """Fields without a dedicated slot in the packed layout"""
+        _, _, username_len, email_len = self._header()
+        tail = self.data[_HEADER.size + username_len + email_len:]
+        return json.loads(tail) if tail else {}
+
+    def replace(self, updated_at: int, **changes) -> bytes:
+        """Packed copy with ``changes`` applied; the record itself is unchanged"""
+        current = self.to_dict()
+        extra = self.extra()
+        for key, value in changes.items():
+            if key in ('username', 'email', 'status'):
+                current[key] = value
+            elif key not in ('id', 'created_at', 'updated_at'):
+                extra[key] = value
+        return pack_user(current['username'], current['email'], updated_at,
+                         current['status'], extra)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.to_dict()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.to_dict())
+
+    def __len__(self) -> int:
+        return len(self.to_dict())
+
+    def __repr__(self) -> str:
+        return '<UserRecord {}>'.format(self.to_dict())
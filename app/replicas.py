@@ -0,0 +1,132 @@
+"""
+Read/write splitting between the primary database and read replicas
+"""
+import itertools
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import TextClause
+
+# session.info key set once a session has written; its reads then stay on the primary
+STICKY_PRIMARY = 'sticky_primary'
+
+
+class ReplicaRouter:
+    """Chooses a replica engine for read-only statements.
+
+    ``round_robin`` cycles through the replicas; ``least_latency`` picks the
+    replica with the lowest moving average of statement latency. An average
+    halves every ``LATENCY_HALF_LIFE`` seconds without new samples. A replica
+    left alone after a slow spell therefore gets tried again, and the fresh
+    samples replace the stale average.
+    """
+
+    STRATEGIES = ('round_robin', 'least_latency')
+    LATENCY_SMOOTHING = 0.2
+    LATENCY_HALF_LIFE = 2.0
+
+    def __init__(self):
+        self.replicas: Dict[str, Engine] = {}
+        self.names: Dict[Engine, str] = {}
+        self.strategy = 'round_robin'
+        self.latency: Dict[str, float] = {}
+        self.sampled_at: Dict[str, float] = {}
+        self._cycle = itertools.cycle(())
+        self._lock = threading.Lock()
+
+    def configure(self, replicas: Dict[str, Engine], strategy: str = 'round_robin') -> None:
+        """Replace the replica set; an empty dict sends everything to the primary"""
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown replica strategy {strategy!r}")
+        for engine in replicas.values():
+            if not event.contains(engine, 'before_cursor_execute', _start_timer):
+                event.listen(engine, 'before_cursor_execute', _start_timer)
+                event.listen(engine, 'after_cursor_execute', _stop_timer)
+        with self._lock:
+            self.replicas = dict(replicas)
+            self.names = {engine: name for name, engine in replicas.items()}
+            self.strategy = strategy
+            self.latency = {name: 0.0 for name in replicas}
+            now = time.monotonic()
+            self.sampled_at = {name: now for name in replicas}
+            self._cycle = itertools.cycle(list(replicas))
+
+    def choose(self) -> Optional[Engine]:
+        """Replica for the next read, or None when there are none"""
+        if not self.replicas:
+            return None
+        if self.strategy == 'least_latency':
+            now = time.monotonic()
+            name = min(self.latency, key=lambda replica: self._aged(replica, now))
+        else:
+            name = next(self._cycle)
+        return self.replicas[name]
+
+    def _aged(self, name: str, now: float) -> float:
+        idle = now - self.sampled_at.get(name, now)
+        return self.latency[name] * 0.5 ** (idle / self.LATENCY_HALF_LIFE)
+
+    def record_latency(self, name: str, seconds: float) -> None:
+        """Fold one statement's latency into the replica's (aged) moving average"""
+        if name not in self.latency:
+            return
+        now = time.monotonic()
+        current = self._aged(name, now)
+        self.latency[name] = current + self.LATENCY_SMOOTHING * (seconds - current)
+        self.sampled_at[name] = now
+
+
+replica_router = ReplicaRouter()
+
+
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['replica_query_start'] = time.perf_counter()
+
+
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('replica_query_start', None)
+    name = replica_router.names.get(conn.engine)
+    if started is not None and name is not None:
+        replica_router.record_latency(name, time.perf_counter() - started)
+
+
+def is_read_only(clause: Any) -> bool:
+    """Whether a statement only reads: ORM/Core selects and textual SELECTs"""
+    if clause is None:
+        return False
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() == 'SELECT'
+    return bool(getattr(clause, 'is_select', False))
+
+
+def pin_to_primary(session) -> None:
+    """Send all further statements of ``session`` to the primary"""
+    session.info[STICKY_PRIMARY] = True
+
+
+class RoutingSession(Session):
+    """Session sending reads on the default bind to a replica.
+
+    Writes, flushes and anything not recognisably read-only go to the
+    primary. After the first write, the rest of the session (one app context,
+    so one request) reads from the primary too (read-your-writes).
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not replica_router.replicas:
+            return primary
+        # models with their own bind_key are not replicated
+        if primary is not self._db.engines.get(None):
+            return primary
+
+        if self._flushing or (clause is not None and not is_read_only(clause)):
+            self.info[STICKY_PRIMARY] = True
+            return primary
+        if self.info.get(STICKY_PRIMARY) or clause is None:
+            return primary
+        return replica_router.choose() or primary
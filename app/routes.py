@@ -1,16 +1,76 @@
-from flask import json, jsonify, request
+import math
+import time
+from json import JSONEncoder
+
+from flask import Response, g, jsonify, request, stream_with_context
 from app import app
-from app import db
-from app.models import Menu
-from app.utils import format_response, get_current_timestamp, validate_input
+from app.utils import IdGenerator, format_response, get_current_timestamp, get_dropped_log_count, validate_input
 from app.config import Config
-from app.services import UserService, DataService, SecurityService, AnalyticsService
+from app import schemas
+from app.schemas import validate_json
+from app.codecs import request_payload, respond
+from app.concurrency import ConcurrencyLimiter, SingleFlightTimeout
+from app.jobs import JobQueue, JobQueueFull
+from app.sketches import PayloadStats, SharedPayloadStats
+from app.storage import build_user_store
+from app.services import UserService, DataService, SecurityService, AnalyticsService, MenuService, MenuSearchService, ReadinessService, process_data_job
 
 # Initialize services
-user_service = UserService()
-data_service = DataService()
+user_service = UserService(id_generator=IdGenerator(host_id=Config.WORKER_ID),
+                           store=build_user_store(Config.USER_STORE_SHARDS, Config.USER_STORE_RING))
+data_service = DataService(stats=PayloadStats(top_k=Config.PAYLOAD_STATS_TOP_K),
+                           shared_stats=SharedPayloadStats(Config.PAYLOAD_STATS_FILE)
+                           if Config.PAYLOAD_STATS_FILE else None)
 security_service = SecurityService()
 analytics_service = AnalyticsService()
+menu_service = MenuService()
+menu_search_service = MenuSearchService()
+readiness_service = ReadinessService(db_check_ttl=Config.READINESS_DB_TTL)
+export_encoder = JSONEncoder(separators=(',', ':'))
+job_queue = JobQueue(Config.JOB_EXECUTOR, Config.JOB_WORKERS, Config.JOB_MAX_PENDING,
+                     Config.JOB_RESULT_TTL, Config.JOB_MAX_RESULTS,
+                     listener=analytics_service.record_job)
+analytics_service.register_gauge('job_queue_depth', job_queue.depth)
+admission_limiter = ConcurrencyLimiter(Config.ADMISSION_MAX_CONCURRENCY, Config.ADMISSION_MAX_QUEUE)
+
+# Priority lane: probes and monitoring are never queued or shed
+PRIORITY_ENDPOINTS = frozenset(['health_check', 'readiness', 'get_metrics'])
+
+def request_started_at():
+    """Arrival time in epoch seconds, from X-Request-Start when a router sets it.
+
+    Accepts both the epoch-milliseconds form and nginx's ``t=<seconds>`` form,
+    so time spent in the router and gunicorn backlog counts against the deadline.
+    """
+    header = request.headers.get('X-Request-Start', '')
+    try:
+        started = float(header.replace('t=', '', 1))
+    except ValueError:
+        return time.time()
+    if not math.isfinite(started):
+        return time.time()
+    return started / 1000 if started > 1e11 else started
+
+def unavailable(body):
+    """503 with Retry-After, so clients and balancers back off instead of retrying at once"""
+    return respond(body, 503, {'Retry-After': str(Config.RETRY_AFTER)})
+
+@app.before_request
+def admit_request():
+    """Admission control: wait for a slot until the deadline, else fail fast"""
+    if request.endpoint in PRIORITY_ENDPOINTS:
+        return None
+    # a header from the future must not extend the wait beyond REQUEST_DEADLINE
+    g.deadline = min(request_started_at(), time.time()) + Config.REQUEST_DEADLINE
+    if not admission_limiter.acquire(timeout=g.deadline - time.time()):
+        return unavailable({"error": "Service overloaded, retry later"})
+    g.admitted = True
+    return None
+
+@app.teardown_request
+def release_request(exc):
+    if g.pop('admitted', False):
+        admission_limiter.release()
 
 @app.route('/')
 def home():
@@ -18,15 +78,70 @@ def home():
 
 @app.route('/menu')
 def menu():
-    today = Menu.query.first()
+    try:
+        today = menu_service.today_special()
+    except SingleFlightTimeout:
+        # the shared lookup is still running; back off like any overload
+        return unavailable({"error": "Service overloaded, retry later"})
     if today:
-        body = { "today_special": today.name }
+        body = { "today_special": today }
         status = 200
     else:
         body = { "error": "Sorry, the service is not available today." }
         status = 404
     return jsonify(body), status
 
+@app.route('/api/v1/menu')
+def list_menu():
+    """List menus page by page; pass next_after back as ?after= for the next page"""
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(menu_service.list_page(after=after, limit=limit))
+
+@app.route('/api/v1/menu/export')
+def export_menu():
+    """Stream the whole menu catalog as a JSON array or NDJSON"""
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'ndjson'):
+        return jsonify({"error": "format must be 'json' or 'ndjson'"}), 400
+
+    # one chunk per fetched batch keeps both memory and per-write overhead low
+    def generate_ndjson():
+        for batch in menu_service.iter_batches():
+            yield ''.join(export_encoder.encode(item) + '\n' for item in batch)
+
+    def generate_json():
+        separator = ''
+        yield '['
+        for batch in menu_service.iter_batches():
+            if batch:
+                yield separator + export_encoder.encode(batch)[1:-1]
+                separator = ','
+        yield ']'
+
+    if export_format == 'ndjson':
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(generate_json()), mimetype='application/json')
+
+@app.route('/api/v1/menu/search')
+def search_menu():
+    """Full-text search over menu names; mode=prefix for autocomplete"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+
+    mode = request.args.get('mode', 'fulltext')
+    if mode not in ('fulltext', 'prefix'):
+        return jsonify({"error": "mode must be 'fulltext' or 'prefix'"}), 400
+
+    limit = request.args.get('limit', 10, type=int)
+    results = menu_search_service.search(query, prefix=(mode == 'prefix'), limit=limit)
+    return jsonify({
+        "query": query,
+        "mode": mode,
+        "results": results
+    })
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
@@ -36,6 +151,19 @@ def health_check():
         "service": "third-party-integration-demo"
     })
 
+@app.route('/ready')
+def readiness():
+    """Readiness probe: 503 while shedding load or when the database is unreachable"""
+    database = readiness_service.check_database()
+    overloaded = admission_limiter.saturated()
+    ready = database['ok'] and not overloaded
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "overloaded": overloaded,
+        "database": database
+    }
+    return respond(body) if ready else unavailable(body)
+
 @app.route('/test-integration')
 def test_integration():
     """Test endpoint for SonarCloud integration"""
@@ -53,21 +181,22 @@ def utils_test():
     return jsonify(formatted_response)
 
 @app.route('/api/v1/data', methods=['GET', 'POST'])
+@validate_json(schemas.ANY_OBJECT)
 def handle_data():
     """API endpoint for data handling with validation"""
     if request.method == 'GET':
-        return jsonify({
+        return respond({
             "message": "Data endpoint working",
             "method": "GET",
             "timestamp": get_current_timestamp()
         })
     
     elif request.method == 'POST':
-        data = request.get_json()
+        data = request_payload()
         if not validate_input(data):
-            return jsonify({"error": "Invalid input data"}), 400
+            return respond({"error": "Invalid input data"}, 400)
         
-        return jsonify(format_response(data, "created"))
+        return respond(format_response(data, "created"))
 
 @app.route('/metrics')
 def get_metrics():
@@ -76,7 +205,9 @@ def get_metrics():
         "uptime": "100%",
         "response_time": "50ms",
         "requests_per_second": 10,
-        "error_rate": "0.1%"
+        "error_rate": "0.1%",
+        "log_records_dropped": get_dropped_log_count(),
+        "admission": admission_limiter.stats()
     })
 
 @app.route('/config')
@@ -90,89 +221,136 @@ def get_config():
 
 # New service-based endpoints
 @app.route('/api/v1/users', methods=['POST'])
+@validate_json(schemas.CREATE_USER)
 def create_user():
     """Create a new user"""
     try:
-        data = request.get_json()
-        if not data or 'username' not in data or 'email' not in data:
-            return jsonify({"error": "Username and email are required"}), 400
-        
+        data = request_payload()
         user = user_service.create_user(data['username'], data['email'])
-        return jsonify(format_response(user, "user_created")), 201
+        return respond(format_response(user.to_dict(), "user_created"), 201)
     except ValueError as e:
-        return jsonify({"error": str(e)}), 400
+        return respond({"error": str(e)}, 400)
+
+@app.route('/api/v1/users', methods=['GET'])
+def list_users():
+    """List users in creation order; pass next_after back as ?after= for the next page"""
+    limit = request.args.get('limit', 50, type=int)
+    return respond(user_service.list_users(after=request.args.get('after'), limit=limit))
 
 @app.route('/api/v1/users/<user_id>', methods=['GET'])
 def get_user(user_id):
     """Get user by ID"""
     user = user_service.get_user(user_id)
     if not user:
-        return jsonify({"error": "User not found"}), 404
-    return jsonify(user)
+        return respond({"error": "User not found"}, 404)
+    return respond(user.to_dict())
 
 @app.route('/api/v1/users/<user_id>', methods=['PUT'])
+@validate_json(schemas.UPDATE_USER)
 def update_user(user_id):
     """Update user information"""
-    data = request.get_json()
+    data = request_payload()
     user = user_service.update_user(user_id, **data)
     if not user:
-        return jsonify({"error": "User not found"}), 404
-    return jsonify(user)
+        return respond({"error": "User not found"}, 404)
+    return respond(user.to_dict())
 
 @app.route('/api/v1/users/<user_id>', methods=['DELETE'])
 def delete_user(user_id):
     """Delete user"""
     success = user_service.delete_user(user_id)
     if not success:
-        return jsonify({"error": "User not found"}), 404
-    return jsonify({"message": "User deleted successfully"})
+        return respond({"error": "User not found"}, 404)
+    return respond({"message": "User deleted successfully"})
 
 @app.route('/api/v1/process', methods=['POST'])
+@validate_json(schemas.ANY_OBJECT)
 def process_data():
     """Process data using DataService"""
-    data = request.get_json()
+    data = request_payload()
     if not validate_input(data):
-        return jsonify({"error": "Invalid input data"}), 400
+        return respond({"error": "Invalid input data"}, 400)
     
-    processed = data_service.process_data(data)
-    return jsonify(processed)
+    if request.args.get('async') not in ('1', 'true') and \
+            'respond-async' not in request.headers.get('Prefer', ''):
+        processed = data_service.process_data(data)
+        return respond(processed)
+
+    # the job pool is separate from request threads, so bulk payloads do
+    # not hold up interactive requests
+    try:
+        if job_queue.executor_kind == 'thread':
+            job_id = job_queue.submit(data_service.process_data, data)
+        else:
+            # statistics are kept here, not in the worker process
+            job_id = job_queue.submit(process_data_job, data, on_result=data_service.observe)
+    except JobQueueFull:
+        return unavailable({"error": "Job queue is full, retry later"})
+    status_url = f'/api/v1/process/jobs/{job_id}'
+    return respond({"job_id": job_id, "status": "queued", "status_url": status_url},
+                   202, {'Location': status_url})
+
+@app.route('/api/v1/process/jobs/<job_id>', methods=['GET'])
+def get_process_job(job_id):
+    """Poll an async process job; results expire JOB_RESULT_TTL seconds after finishing"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return respond({"error": "Job not found or expired"}, 404)
+    return respond(job)
 
 @app.route('/api/v1/security/password', methods=['POST'])
+@validate_json(schemas.GENERATE_PASSWORD, optional=True)
 def generate_password():
     """Generate secure password"""
-    data = request.get_json()
+    data = request_payload()
     length = data.get('length', 12) if data else 12
     
     password = security_service.generate_password(length)
     hashed = security_service.hash_password(password)
     
-    return jsonify({
+    return respond({
         "password": password,
         "hashed": hashed,
         "length": length
     })
 
 @app.route('/api/v1/security/verify', methods=['POST'])
+@validate_json(schemas.VERIFY_PASSWORD)
 def verify_password():
     """Verify password"""
-    data = request.get_json()
-    if not data or 'password' not in data or 'hashed' not in data:
-        return jsonify({"error": "Password and hash are required"}), 400
-    
+    data = request_payload()
     is_valid = security_service.verify_password(data['password'], data['hashed'])
-    return jsonify({"valid": is_valid})
+    return respond({"valid": is_valid})
 
 @app.route('/api/v1/analytics', methods=['GET'])
 def get_analytics():
     """Get analytics metrics"""
     metrics = analytics_service.get_metrics()
-    return jsonify(metrics)
+    return respond(metrics)
+
+@app.route('/api/v1/analytics/payloads', methods=['GET'])
+def get_payload_analytics():
+    """Streaming statistics over processed payloads.
+
+    Merged over all workers when PAYLOAD_STATS_FILE is set, otherwise only
+    this worker's; ``workers`` names the workers covered either way.
+    ?format=sketch returns the raw sketches, which PayloadStats.from_dict and
+    merge combine.
+    """
+    stats, workers = data_service.payload_stats()
+    if request.args.get('format') == 'sketch':
+        body = stats.to_dict()
+    else:
+        top = min(max(request.args.get('top', 10, type=int), 1), Config.PAYLOAD_STATS_TOP_K)
+        body = stats.summary(top=top)
+    body['workers'] = workers
+    return respond(body)
 
 @app.route('/api/v1/analytics/reset', methods=['POST'])
 def reset_analytics():
     """Reset analytics metrics"""
     old_metrics = analytics_service.reset_metrics()
-    return jsonify({
+    return respond({
         "message": "Analytics reset successfully",
         "previous_metrics": old_metrics
     })
\ No newline at end of file
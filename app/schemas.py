@@ -0,0 +1,148 @@
+"""
+Request payload schemas and validation
+"""
+import re
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app, g, request
+
+from app.codecs import PayloadTooComplex, request_codec, respond, supported_media_types
+from app.records import USER_STATUSES
+
+BODY_METHODS = frozenset(['POST', 'PUT', 'PATCH'])
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+def _compile_field(name: str, spec: Dict[str, Any]) -> Callable[[Dict[str, Any], List[str]], None]:
+    """Build a check function for one field; all spec lookups happen here, once"""
+    expected = spec.get('type')
+    required = spec.get('required', False)
+    checks = []
+
+    if expected is int:
+        checks.append((lambda v: isinstance(v, int) and not isinstance(v, bool), "must be an integer"))
+    elif expected is not None:
+        type_name = {str: 'a string', dict: 'an object', list: 'an array', bool: 'a boolean'}.get(
+            expected, expected.__name__)
+        checks.append((lambda v: isinstance(v, expected), f"must be {type_name}"))
+    if 'min_length' in spec:
+        min_length = spec['min_length']
+        checks.append((lambda v: len(v) >= min_length, f"must have length >= {min_length}"))
+    if 'max_length' in spec:
+        max_length = spec['max_length']
+        checks.append((lambda v: len(v) <= max_length, f"must have length <= {max_length}"))
+    if 'min' in spec:
+        minimum = spec['min']
+        checks.append((lambda v: v >= minimum, f"must be >= {minimum}"))
+    if 'max' in spec:
+        maximum = spec['max']
+        checks.append((lambda v: v <= maximum, f"must be <= {maximum}"))
+    if 'choices' in spec:
+        choices = frozenset(spec['choices'])
+        checks.append((lambda v: v in choices, "must be one of " + ", ".join(spec['choices'])))
+    if 'pattern' in spec:
+        matcher = re.compile(spec['pattern']).match
+        checks.append((lambda v: matcher(v) is not None, "has an invalid format"))
+
+    def check(data: Dict[str, Any], errors: List[str]) -> None:
+        if name not in data:
+            if required:
+                errors.append(f"'{name}' is required")
+            return
+        value = data[name]
+        # later checks assume the earlier ones (starting with the type) passed
+        for predicate, message in checks:
+            if not predicate(value):
+                errors.append(f"'{name}' {message}")
+                return
+
+    return check
+
+
+def compile_schema(fields: Dict[str, Dict[str, Any]],
+                   allow_extra: bool = False) -> Callable[[Any], List[str]]:
+    """Compile a declarative schema into a function returning a list of errors"""
+    field_checks = [_compile_field(name, spec) for name, spec in fields.items()]
+    known = frozenset(fields)
+
+    def validate(data: Any) -> List[str]:
+        if not isinstance(data, dict):
+            return ["Payload must be a JSON object"]
+        errors: List[str] = []
+        for check in field_checks:
+            check(data, errors)
+        if not allow_extra:
+            errors.extend(f"'{key}' is not allowed" for key in data if key not in known)
+        return errors
+
+    return validate
+
+
+def validate_json(validator: Optional[Callable[[Any], List[str]]] = None,
+                  optional: bool = False):
+    """Decorator enforcing payload limits and a compiled schema before the view runs.
+
+    The body is decoded by the codec matching its Content-Type (see
+    app.codecs); limits come from MAX_CONTENT_LENGTH, JSON_MAX_DEPTH and
+    JSON_MAX_KEYS. The decoded payload is cached for ``request_payload()``,
+    so the view does not decode again. Only methods that carry a body are
+    checked; with ``optional`` an empty body is accepted as well.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in BODY_METHODS:
+                return view(*args, **kwargs)
+
+            max_length = current_app.config.get('MAX_CONTENT_LENGTH')
+            if max_length is not None and (request.content_length or 0) > max_length:
+                return respond({"error": "Payload too large"}, 413)
+
+            body = request.get_data(cache=True)
+            if optional and not body:
+                return view(*args, **kwargs)
+            codec = request_codec()
+            if codec is None:
+                return respond({"error": "Unsupported Content-Type",
+                                "supported": supported_media_types()}, 415)
+            try:
+                data = codec.decode(body,
+                                    current_app.config['JSON_MAX_DEPTH'],
+                                    current_app.config['JSON_MAX_KEYS'])
+            except PayloadTooComplex as e:
+                return respond({"error": str(e)}, 413)
+            except ValueError:
+                return respond({"error": "Invalid input data",
+                                "details": [f"Body must be valid {codec.media_type}"]}, 400)
+
+            if validator is not None:
+                errors = validator(data)
+                if errors:
+                    return respond({"error": "Invalid input data", "details": errors}, 400)
+            g.payload = data
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+ANY_OBJECT = compile_schema({}, allow_extra=True)
+
+CREATE_USER = compile_schema({
+    'username': {'type': str, 'required': True, 'min_length': 1, 'max_length': 64},
+    'email': {'type': str, 'required': True, 'max_length': 254, 'pattern': EMAIL_PATTERN},
+})
+
+UPDATE_USER = compile_schema({
+    'username': {'type': str, 'min_length': 1, 'max_length': 64},
+    'email': {'type': str, 'max_length': 254, 'pattern': EMAIL_PATTERN},
+    'status': {'type': str, 'choices': USER_STATUSES},
+})
+
+GENERATE_PASSWORD = compile_schema({
+    'length': {'type': int, 'min': 4, 'max': 128},
+})
+
+VERIFY_PASSWORD = compile_schema({
+    'password': {'type': str, 'required': True, 'max_length': 1024},
+    'hashed': {'type': str, 'required': True, 'max_length': 1024},
+})
@@ -2,80 +2,163 @@
 Business logic services for the application
 """
 import hashlib
+import re
 import secrets
 import string
-from typing import Dict, Any, List, Optional
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 import json
 
+from sqlalchemy import and_, select, text
+
+from app import db
+from app.concurrency import SingleFlight, single_flight
+from app.models import Menu
+from app.records import UserRecord, pack_user
+from app.sketches import PayloadStats, SharedPayloadStats, worker_name
+from app.storage import KeyValueStore, ShardedStore
+from app.utils import IdGenerator
+
 
 class UserService:
-    """Service for user management"""
+    """Service for user management
     
-    def __init__(self):
-        self.users = {}
+    Users are stored as packed, immutable bytes keyed by the integer form of
+    their ID and handed out as UserRecord views; call ``to_dict()`` at the
+    JSON boundary.
+    """
+    
+    MAX_PAGE_SIZE = 500
     
-    def create_user(self, username: str, email: str) -> Dict[str, Any]:
+    def __init__(self, id_generator: Optional[IdGenerator] = None,
+                 store: Optional[KeyValueStore] = None):
+        self.users = store if store is not None else ShardedStore()
+        self.id_generator = id_generator or IdGenerator()
+    
+    def create_user(self, username: str, email: str) -> UserRecord:
         """Create a new user"""
         if not username or not email:
             raise ValueError("Username and email are required")
         
-        user_id = self._generate_user_id()
-        user = {
-            'id': user_id,
-            'username': username,
-            'email': email,
-            'created_at': datetime.now().isoformat(),
-            'status': 'active'
-        }
+        # created_at is the timestamp encoded in the ID
+        key = self.id_generator.next_int()
+        data = pack_user(username, email)
         
-        self.users[user_id] = user
-        return user
+        if not self.users.insert_if_absent(key, data):
+            raise ValueError("User ID collision")
+        return UserRecord(key, data)
     
-    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+    def get_user(self, user_id: str) -> Optional[UserRecord]:
         """Get user by ID"""
-        return self.users.get(user_id)
+        key = self._key(user_id)
+        if key is None:
+            return None
+        data = self.users.get(key)
+        return UserRecord(key, data) if data is not None else None
+    
+    def list_users(self, after: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """Users in ID (creation) order, starting after the ``after`` ID (keyset pagination)"""
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+        after_key = self._key(after) if after else None
+        items = [UserRecord(key, data).to_dict() for key, data in self.users.items_after(after_key, limit)]
+        next_after = items[-1]['id'] if len(items) == limit else None
+        return {'items': items, 'next_after': next_after}
     
-    def update_user(self, user_id: str, **kwargs) -> Optional[Dict[str, Any]]:
-        """Update user information"""
-        if user_id not in self.users:
+    def update_user(self, user_id: str, **kwargs) -> Optional[UserRecord]:
+        """Update user information atomically (copy on write)"""
+        key = self._key(user_id)
+        if key is None:
             return None
         
-        self.users[user_id].update(kwargs)
-        self.users[user_id]['updated_at'] = datetime.now().isoformat()
-        return self.users[user_id]
+        def apply(current: bytes) -> bytes:
+            return UserRecord(key, current).replace(self._now_ms(), **kwargs)
+        
+        data = self.users.update(key, apply)
+        return UserRecord(key, data) if data is not None else None
+    
+    def compare_and_set_user(self, user_id: str, expected: UserRecord, **kwargs) -> Optional[UserRecord]:
+        """Apply an update only if the user is still the ``expected`` record
+        returned by an earlier read; None if it changed or was deleted"""
+        key = self._key(user_id)
+        if key is None:
+            return None
+        updated = expected.replace(self._now_ms(), **kwargs)
+        if self.users.compare_and_set(key, expected.data, updated):
+            return UserRecord(key, updated)
+        return None
     
     def delete_user(self, user_id: str) -> bool:
         """Delete user"""
-        if user_id in self.users:
-            del self.users[user_id]
-            return True
-        return False
+        key = self._key(user_id)
+        return key is not None and self.users.delete(key)
     
-    def _generate_user_id(self) -> str:
-        """Generate unique user ID"""
-        return hashlib.md5(f"{datetime.now()}{secrets.token_hex(8)}".encode()).hexdigest()[:8]
+    @staticmethod
+    def _key(user_id: str) -> Optional[int]:
+        """Store key for a user ID string; None for strings that cannot be IDs"""
+        if not isinstance(user_id, str) or len(user_id) != 32:
+            return None
+        try:
+            return int(user_id, 16)
+        except ValueError:
+            return None
+    
+    @staticmethod
+    def _now_ms() -> int:
+        return time.time_ns() // 1_000_000
 
 
 class DataService:
     """Service for data processing"""
     
-    def __init__(self):
+    def __init__(self, coalesce_timeout: Optional[float] = 30.0, stats: Optional[PayloadStats] = None,
+                 shared_stats: Optional[SharedPayloadStats] = None):
         self.cache = {}
+        self.coalesce_timeout = coalesce_timeout
+        self.stats = stats
+        self.shared_stats = shared_stats
+        self._in_flight = SingleFlight()
     
     def process_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Process input data"""
+        """Process input data; identical payloads in flight at the same time share one result"""
+        # serialize once: the sorted form gives both the checksum and the
+        # size, since key order does not change the length
+        data_str = json.dumps(data, sort_keys=True)
+        checksum = hashlib.sha256(data_str.encode()).hexdigest()
+        processed = self._in_flight.do(checksum, self._process, (data, checksum, len(data_str)),
+                                       timeout=self.coalesce_timeout)
+        self.observe(processed)
+        return processed
+    
+    def observe(self, processed: Dict[str, Any]) -> None:
+        """Fold a process_data result into the payload statistics, if kept"""
+        if self.stats is not None:
+            self.stats.observe(processed['original'], processed['size'], processed['checksum'])
+            if self.shared_stats is not None:
+                self.shared_stats.publish(self.stats)
+
+    def payload_stats(self) -> Tuple[PayloadStats, List[str]]:
+        """Payload statistics and the workers they cover.
+
+        With ``shared_stats`` these are merged over every worker, otherwise
+        they only cover this process.
+        """
+        if self.shared_stats is None:
+            return self.stats, [worker_name()]
+        self.shared_stats.publish(self.stats, force=True)
+        return self.shared_stats.merged()
+    
+    def _process(self, data: Dict[str, Any], checksum: str, size: int) -> Dict[str, Any]:
         processed = {
             'original': data,
             'processed_at': datetime.now().isoformat(),
-            'checksum': self._calculate_checksum(data),
-            'size': len(json.dumps(data)),
+            'checksum': checksum,
+            'size': size,
             'fields_count': len(data.keys())
         }
         
         # Cache the result
-        cache_key = self._calculate_checksum(data)
-        self.cache[cache_key] = processed
+        self.cache[checksum] = processed
         
         return processed
     
@@ -95,6 +178,17 @@ class DataService:
         return hashlib.sha256(data_str.encode()).hexdigest()
 
 
+_worker_data_service: Optional[DataService] = None
+
+
+def process_data_job(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Picklable process_data for process-pool jobs; one DataService per worker process"""
+    global _worker_data_service
+    if _worker_data_service is None:
+        _worker_data_service = DataService()
+    return _worker_data_service.process_data(data)
+
+
 class SecurityService:
     """Service for security operations"""
     
@@ -152,6 +246,26 @@ class AnalyticsService:
             'errors': 0,
             'start_time': datetime.now().isoformat()
         }
+        self.jobs = self._empty_job_metrics()
+        self.gauges: Dict[str, Callable[[], Any]] = {}
+    
+    @staticmethod
+    def _empty_job_metrics() -> Dict[str, Any]:
+        return {'submitted': 0, 'rejected': 0, 'done': 0, 'failed': 0,
+                'latency_ms_total': 0.0, 'latency_ms_max': 0.0}
+    
+    def register_gauge(self, name: str, read: Callable[[], Any]) -> None:
+        """Report ``read()`` under ``name`` in every metrics snapshot"""
+        self.gauges[name] = read
+    
+    def record_job(self, event: str, latency: Optional[float] = None) -> None:
+        """Record a background job event (JobQueue listener); latency in seconds"""
+        jobs = self.jobs
+        jobs[event] = jobs.get(event, 0) + 1
+        if latency is not None:
+            latency_ms = latency * 1000
+            jobs['latency_ms_total'] += latency_ms
+            jobs['latency_ms_max'] = max(jobs['latency_ms_max'], latency_ms)
     
     def record_request(self, endpoint: str, status_code: int) -> None:
         """Record API request"""
@@ -165,15 +279,175 @@ class AnalyticsService:
         return {
             **self.metrics,
             'uptime_seconds': int(uptime.total_seconds()),
-            'error_rate': (self.metrics['errors'] / max(self.metrics['requests'], 1)) * 100
+            'error_rate': (self.metrics['errors'] / max(self.metrics['requests'], 1)) * 100,
+            'jobs': self._job_metrics(),
+            **{name: read() for name, read in self.gauges.items()}
         }
     
+    def _job_metrics(self) -> Dict[str, Any]:
+        jobs = dict(self.jobs)
+        finished = jobs['done'] + jobs['failed']
+        jobs['latency_ms_avg'] = round(jobs.pop('latency_ms_total') / finished, 2) if finished else 0.0
+        jobs['latency_ms_max'] = round(jobs['latency_ms_max'], 2)
+        return jobs
+    
     def reset_metrics(self) -> Dict[str, Any]:
         """Reset metrics and return previous values"""
-        old_metrics = self.metrics.copy()
+        old_metrics = {**self.metrics, 'jobs': self._job_metrics()}
         self.metrics = {
             'requests': 0,
             'errors': 0,
             'start_time': datetime.now().isoformat()
         }
-        return old_metrics 
\ No newline at end of file
+        self.jobs = self._empty_job_metrics()
+        return old_metrics
+
+
+class ReadinessService:
+    """Database reachability for readiness probes, cached for ``db_check_ttl`` seconds.
+
+    Probes arrive from every load balancer node every few seconds; caching
+    (and coalescing the refresh) keeps them from adding database load.
+    """
+
+    def __init__(self, db_check_ttl: float = 5.0):
+        self.db_check_ttl = db_check_ttl
+        self._database: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._in_flight = SingleFlight()
+
+    def check_database(self) -> Dict[str, Any]:
+        """Latest database check result, refreshed once the TTL has passed"""
+        if self._database is None or time.monotonic() - self._checked_at >= self.db_check_ttl:
+            return self._in_flight.do('database', self._refresh)
+        return self._database
+
+    def _refresh(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            # the engine, not the session, so replicas never answer for the primary
+            with db.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            result = {'ok': True}
+        except Exception as e:
+            result = {'ok': False, 'error': type(e).__name__}
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        self._database = result
+        self._checked_at = time.monotonic()
+        return result
+
+
+class MenuService:
+    """Service for listing and exporting the menu catalog"""
+
+    MAX_PAGE_SIZE = 500
+    EXPORT_BATCH_SIZE = 1000
+
+    @single_flight(key=lambda self: 'menu:today_special', timeout=5.0)
+    def today_special(self) -> Optional[str]:
+        """Name of today's special; concurrent callers share one query"""
+        today = Menu.query.first()
+        return today.name if today else None
+
+    def list_page(self, after: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """Return menus with id greater than ``after`` (keyset pagination)"""
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+        statement = (
+            select(Menu.id, Menu.name)
+            .where(Menu.id > after)
+            .order_by(Menu.id)
+            .limit(limit)
+        )
+        items = [{'id': row.id, 'name': row.name} for row in db.session.execute(statement)]
+        next_after = items[-1]['id'] if len(items) == limit else None
+        return {'items': items, 'next_after': next_after}
+
+    def iter_batches(self, batch_size: Optional[int] = None):
+        """Yield every menu as lists of dicts, one list per server-side cursor fetch"""
+        batch_size = batch_size or self.EXPORT_BATCH_SIZE
+        statement = (
+            select(Menu.id, Menu.name)
+            .order_by(Menu.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for rows in db.session.execute(statement).partitions():
+            yield [{'id': row.id, 'name': row.name} for row in rows]
+
+
+class MenuSearchService:
+    """Service for full-text search and autocomplete over menu names"""
+
+    MAX_LIMIT = 50
+    MAX_TOKENS = 8
+
+    # Ranking scores no more than RANK_CANDIDATES matches, the newest ones
+    # (highest rowid first), so a query on a very common word costs the same
+    # as a selective one however large the table grows. Within that set rows
+    # are ordered by bm25 (FTS5's rank column), so names where the query
+    # terms carry more weight come first; bm25 is lower-is-better, the
+    # returned score is negated. Ordering every match by rank instead costs
+    # a full doclist scan plus a sort, hundreds of ms on a common word.
+    RANK_CANDIDATES = 1000
+
+    SQLITE_RANKED = text(
+        "SELECT menu.id, menu.name, -candidates.rank AS score FROM ("
+        "SELECT rowid, rank FROM menu_fts WHERE menu_fts MATCH :match "
+        "ORDER BY rowid DESC LIMIT :candidates"
+        ") AS candidates JOIN menu ON menu.id = candidates.rowid "
+        "ORDER BY candidates.rank, menu.id DESC LIMIT :limit"
+    )
+    # Autocomplete walks the index in rowid order and stops at LIMIT instead
+    # of scoring every row that shares a popular prefix.
+    SQLITE_PREFIX = text(
+        "SELECT menu.id, menu.name, NULL AS score FROM menu_fts "
+        "JOIN menu ON menu.id = menu_fts.rowid "
+        "WHERE menu_fts MATCH :match LIMIT :limit"
+    )
+    POSTGRES_RANKED = text(
+        "SELECT id, name, ts_rank(to_tsvector('simple', coalesce(name, '')), "
+        "to_tsquery('simple', :match)) AS score FROM ("
+        "SELECT id, name FROM menu "
+        "WHERE to_tsvector('simple', coalesce(name, '')) @@ to_tsquery('simple', :match) "
+        "ORDER BY id DESC LIMIT :candidates"
+        ") AS candidates ORDER BY score DESC, id DESC LIMIT :limit"
+    )
+
+    def search(self, query: str, prefix: bool = False, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search menu names; ``prefix`` treats the last token as a prefix"""
+        tokens = self._tokenize(query)
+        if not tokens:
+            return []
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        dialect = db.session.get_bind(mapper=Menu).dialect.name
+        if dialect == 'sqlite':
+            match = ' '.join('"{}"'.format(token) for token in tokens)
+            statement = self.SQLITE_RANKED
+            if prefix:
+                match += '*'
+                statement = self.SQLITE_PREFIX
+            rows = db.session.execute(statement, {
+                'match': match, 'limit': limit, 'candidates': self.RANK_CANDIDATES})
+        elif dialect == 'postgresql':
+            match = ' & '.join(tokens) + (':*' if prefix else '')
+            rows = db.session.execute(self.POSTGRES_RANKED, {'match': match, 'limit': limit,
+                                                             'candidates': self.RANK_CANDIDATES})
+        else:
+            return self._search_like(tokens, limit)
+
+        return [
+            {'id': row.id, 'name': row.name, 'score': row.score}
+            for row in rows
+        ]
+
+    def _search_like(self, tokens: List[str], limit: int) -> List[Dict[str, Any]]:
+        """Unindexed fallback for databases without full-text support"""
+        conditions = [Menu.name.ilike('%{}%'.format(token)) for token in tokens]
+        menus = Menu.query.filter(and_(*conditions)).order_by(Menu.id).limit(limit)
+        return [{'id': menu.id, 'name': menu.name, 'score': None} for menu in menus]
+
+    def _tokenize(self, query: str) -> List[str]:
+        """Split a query into word tokens safe to quote into a MATCH expression"""
+        if not isinstance(query, str):
+            return []
+        return re.findall(r'[^\W_]+', query.lower())[:self.MAX_TOKENS]
@@ -0,0 +1,366 @@
+"""
+Fixed-memory, mergeable streaming summaries
+"""
+import base64
+import hashlib
+import json
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+def hash64(value: str) -> int:
+    """Uniformly distributed 64-bit hash of a string"""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """Distinct-count estimate in ``2 ** precision`` one-byte registers.
+
+    The standard error is about ``1.04 / sqrt(2 ** precision)``, 1.6% at the
+    default precision of 12 (4 KB).
+    """
+
+    def __init__(self, precision: int = 12):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        self.add_hash(hash64(value))
+
+    def add_hash(self, hashed: int) -> None:
+        """Add an already uniformly distributed 64-bit hash"""
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate while many registers are empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'precision': self.precision,
+                'registers': base64.b64encode(self.registers).decode()}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'HyperLogLog':
+        sketch = cls(state['precision'])
+        sketch.registers = bytearray(base64.b64decode(state['registers']))
+        return sketch
+
+
+class SpaceSaving:
+    """Top-K heavy hitters over at most ``capacity`` counters.
+
+    Counts are overestimates by at most the reported ``error``, and any item
+    seen more than ``total / capacity`` times is guaranteed to be tracked.
+    Evicting scans the counters, so keep ``capacity`` modest.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counters: Dict[Hashable, List[int]] = {}
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+        else:
+            # the new item inherits the evicted minimum as its error bound
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + count, floor]
+
+    def _floor(self) -> int:
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other: 'SpaceSaving') -> None:
+        """Combine two summaries, keeping the error bounds valid"""
+        own_floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(item, (own_floor, own_floor))
+            other_count, other_error = other.counters.get(item, (other_floor, other_floor))
+            merged[item] = [count + other_count, error + other_error]
+        top = sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)[:self.capacity]
+        self.counters = dict(top)
+
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        ranked = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)
+        return [{'item': item, 'count': count, 'error': error}
+                for item, (count, error) in ranked[:n]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'capacity': self.capacity,
+                'counters': [[item, count, error] for item, (count, error) in self.counters.items()]}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'SpaceSaving':
+        sketch = cls(state['capacity'])
+        sketch.counters = {item: [count, error] for item, count, error in state['counters']}
+        return sketch
+
+
+class QuantileSketch:
+    """Relative-error quantiles of non-negative values (DDSketch-style).
+
+    Values fall into logarithmic buckets, so every quantile is within
+    ``relative_accuracy`` of a true value. Buckets merge by addition; past
+    ``max_buckets`` the lowest ones are collapsed together.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float) -> None:
+        if value < 0:
+            raise ValueError("QuantileSketch only accepts non-negative values")
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if value == 0:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        keys = sorted(self.buckets)
+        excess = keys[:len(keys) - self.max_buckets + 1]
+        target = keys[len(excess)]
+        self.buckets[target] += sum(self.buckets.pop(key) for key in excess)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                value = 2 * self._gamma ** key / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge quantile sketches of different accuracy")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        while len(self.buckets) > self.max_buckets:
+            self._collapse()
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'relative_accuracy': self.relative_accuracy, 'max_buckets': self.max_buckets,
+                'buckets': [[key, count] for key, count in self.buckets.items()],
+                'zeros': self.zeros, 'count': self.count, 'total': self.total,
+                'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'QuantileSketch':
+        sketch = cls(state['relative_accuracy'], state['max_buckets'])
+        sketch.buckets = {key: count for key, count in state['buckets']}
+        sketch.zeros, sketch.count, sketch.total = state['zeros'], state['count'], state['total']
+        sketch.min, sketch.max = state['min'], state['max']
+        return sketch
+
+
+class PayloadStats:
+    """Running statistics over processed payloads in fixed memory.
+
+    Tracks distinct payloads and distinct field names (HyperLogLog), the most
+    frequent field names and ``name=value`` pairs of scalar top-level fields
+    (space-saving), and serialized sizes (quantile sketch). ``to_dict`` and
+    ``from_dict`` carry the full state between worker processes for merging.
+    """
+
+    MAX_VALUE_LENGTH = 64
+
+    def __init__(self, top_k: int = 64):
+        self.payloads = 0
+        self.distinct_payloads = HyperLogLog()
+        self.distinct_fields = HyperLogLog()
+        self.top_fields = SpaceSaving(top_k)
+        self.top_values = SpaceSaving(top_k)
+        self.sizes = QuantileSketch()
+        self._lock = threading.Lock()
+
+    def observe(self, payload: Dict[str, Any], size: int, checksum: str) -> None:
+        """Fold one payload in; ``checksum`` is its hex SHA-256, reused as the hash"""
+        pairs = [f'{name}={value}'[:self.MAX_VALUE_LENGTH]
+                 for name, value in payload.items()
+                 if value is None or isinstance(value, (str, int, float, bool))]
+        with self._lock:
+            self.payloads += 1
+            self.distinct_payloads.add_hash(int(checksum[:16], 16))
+            for name in payload:
+                self.distinct_fields.add(name)
+                self.top_fields.add(name)
+            for pair in pairs:
+                self.top_values.add(pair)
+            self.sizes.add(size)
+
+    def merge(self, other: 'PayloadStats') -> None:
+        with self._lock:
+            self.payloads += other.payloads
+            self.distinct_payloads.merge(other.distinct_payloads)
+            self.distinct_fields.merge(other.distinct_fields)
+            self.top_fields.merge(other.top_fields)
+            self.top_values.merge(other.top_values)
+            self.sizes.merge(other.sizes)
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            sizes = self.sizes
+            return {
+                'payloads': self.payloads,
+                'distinct_payloads': self.distinct_payloads.count(),
+                'distinct_fields': self.distinct_fields.count(),
+                'top_fields': self.top_fields.top(top),
+                'top_values': self.top_values.top(top),
+                'size': {
+                    'min': sizes.min,
+                    'max': sizes.max,
+                    'mean': round(sizes.total / sizes.count, 2) if sizes.count else None,
+                    'p50': sizes.quantile(0.5),
+                    'p90': sizes.quantile(0.9),
+                    'p99': sizes.quantile(0.99)
+                }
+            }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'payloads': self.payloads,
+                'distinct_payloads': self.distinct_payloads.to_dict(),
+                'distinct_fields': self.distinct_fields.to_dict(),
+                'top_fields': self.top_fields.to_dict(),
+                'top_values': self.top_values.to_dict(),
+                'sizes': self.sizes.to_dict()
+            }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'PayloadStats':
+        stats = cls()
+        stats.payloads = state['payloads']
+        stats.distinct_payloads = HyperLogLog.from_dict(state['distinct_payloads'])
+        stats.distinct_fields = HyperLogLog.from_dict(state['distinct_fields'])
+        stats.top_fields = SpaceSaving.from_dict(state['top_fields'])
+        stats.top_values = SpaceSaving.from_dict(state['top_values'])
+        stats.sizes = QuantileSketch.from_dict(state['sizes'])
+        return stats
+
+
+def worker_name() -> str:
+    """Host and pid of this process, which identify a gunicorn worker"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SharedPayloadStats:
+    """Every worker's PayloadStats, kept in one SQLite file and merged on read.
+
+    ``publish`` hands the statistics to a background thread, which writes
+    this worker's row at most every ``interval`` seconds. The merged view
+    therefore lags other workers by up to that much. Rows of workers that
+    exited stay, so their payloads keep counting.
+    """
+
+    def __init__(self, path: str, interval: float = 5.0, worker: Optional[str] = None):
+        self.path = path
+        self.interval = interval
+        self.worker = worker
+        self._pending: Optional[PayloadStats] = None
+        # the flusher thread does not survive fork, so it is tracked per pid
+        self._flusher_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS payload_stats "
+                         "(worker TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)")
+
+    def _connect(self):
+        # short-lived connections: writes are rare and nothing is carried across fork
+        return closing(sqlite3.connect(self.path, timeout=5.0, isolation_level=None))
+
+    def publish(self, stats: PayloadStats, force: bool = False) -> None:
+        """Schedule this worker's snapshot for the next flush, or write it now with ``force``"""
+        if force:
+            self._write(stats)
+            return
+        self._pending = stats
+        if self._flusher_pid != os.getpid():
+            with self._lock:
+                if self._flusher_pid != os.getpid():
+                    self._flusher_pid = os.getpid()
+                    threading.Thread(target=self._flush_loop, name='payload-stats',
+                                     daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            stats, self._pending = self._pending, None
+            if stats is not None:
+                self._write(stats)
+
+    def _write(self, stats: PayloadStats) -> None:
+        state = json.dumps(stats.to_dict())
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO payload_stats (worker, state, updated_at) "
+                         "VALUES (?, ?, ?)", (self.worker or worker_name(), state, time.time()))
+
+    def merged(self) -> Tuple[PayloadStats, List[str]]:
+        """Statistics merged over all published workers, and those workers' names"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT worker, state FROM payload_stats ORDER BY worker").fetchall()
+        snapshots = [PayloadStats.from_dict(json.loads(state)) for _, state in rows]
+        merged = snapshots[0] if snapshots else PayloadStats()
+        for snapshot in snapshots[1:]:
+            merged.merge(snapshot)
+        return merged, [worker for worker, _ in rows]
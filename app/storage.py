@@ -0,0 +1,681 @@
+"""
+Storage backends for the services
+"""
+import bisect
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from operator import itemgetter
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+_MISSING = object()
+
+
+class KeyValueStore(ABC):
+    """Common interface of the user storage backends.
+
+    Values are treated as immutable; ``update`` is built on
+    ``compare_and_set`` so every backend gets the same atomic
+    read-modify-write.
+    """
+
+    @abstractmethod
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def put(self, key: Hashable, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def insert_if_absent(self, key: Hashable, value: Any) -> bool:
+        ...
+
+    @abstractmethod
+    def compare_and_set(self, key: Hashable, expected: Any, value: Any) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, key: Hashable) -> bool:
+        ...
+
+    @abstractmethod
+    def items_after(self, after: Optional[Hashable], limit: int) -> List[Tuple[Hashable, Any]]:
+        """Up to ``limit`` (key, value) pairs with key > ``after``, in key order"""
+
+    def move_keys(self, keys: Sequence[Hashable], target: 'KeyValueStore') -> int:
+        """Move ``keys`` to ``target``, keeping a value already there; returns how many were here.
+
+        Not atomic: callers must keep other writers of these keys out.
+        """
+        moved = 0
+        for key in keys:
+            value = self.get(key)
+            if value is None:
+                continue
+            target.insert_if_absent(key, value)
+            self.delete(key)
+            moved += 1
+        return moved
+
+    def update(self, key: Hashable, fn: Callable[[Any], Any]) -> Optional[Any]:
+        """Atomically replace the value with ``fn(current)``; None if key is missing.
+
+        ``fn`` runs outside any lock and may be retried if another writer
+        got in first, so it must not have side effects.
+        """
+        while True:
+            current = self.get(key)
+            if current is None:
+                return None
+            new_value = fn(current)
+            if self.compare_and_set(key, current, new_value):
+                return new_value
+
+    def iter_items(self, batch_size: int = 1000) -> Iterator[Tuple[Hashable, Any]]:
+        """Iterate over all (key, value) pairs, batch by batch by key range"""
+        after = None
+        while True:
+            batch = self.items_after(after, batch_size)
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            after = batch[-1][0]
+
+    def values(self) -> Iterator[Any]:
+        """Iterate over all stored values"""
+        for _, value in self.iter_items():
+            yield value
+
+
+class ShardedStore(KeyValueStore):
+    """Thread-safe in-memory store using lock striping over N shards.
+
+    Writers lock only the shard owning the key. Stored values are treated as
+    immutable: updates build a new value and swap it in (copy on write), so
+    lock-free readers always see a complete record, never a half-applied
+    update. ``compare_and_set`` compares by identity, which makes the stored
+    object itself the version. A sorted index of the keys lets
+    ``items_after`` seek to a page instead of scanning every shard. Keys must
+    therefore be mutually orderable. Time-ordered keys are appended at the
+    end of the index.
+    """
+
+    def __init__(self, shards: int = 16):
+        if shards < 1:
+            raise ValueError("shards must be positive")
+        self._shards: List[Dict[Hashable, Any]] = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        # taken inside a shard lock, never the other way round
+        self._keys: List[Hashable] = []
+        self._index_lock = threading.Lock()
+
+    def _index_add(self, key: Hashable) -> None:
+        with self._index_lock:
+            keys = self._keys
+            if not keys or keys[-1] < key:
+                keys.append(key)
+            else:
+                bisect.insort(keys, key)
+
+    def _index_remove(self, key: Hashable) -> None:
+        with self._index_lock:
+            position = bisect.bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                del self._keys[position]
+
+    def _index(self, key: Hashable) -> int:
+        return hash(key) % len(self._shards)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get value by key; readers take no lock"""
+        return self._shards[self._index(key)].get(key, default)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store value, replacing any existing one"""
+        index = self._index(key)
+        with self._locks[index]:
+            shard = self._shards[index]
+            if key not in shard:
+                self._index_add(key)
+            shard[key] = value
+
+    def insert_if_absent(self, key: Hashable, value: Any) -> bool:
+        """Store value only if key is not present; return whether it was stored"""
+        index = self._index(key)
+        with self._locks[index]:
+            shard = self._shards[index]
+            if key in shard:
+                return False
+            shard[key] = value
+            self._index_add(key)
+            return True
+
+    def compare_and_set(self, key: Hashable, expected: Any, value: Any) -> bool:
+        """Replace the value only if the current one is ``expected`` (identity)"""
+        index = self._index(key)
+        with self._locks[index]:
+            shard = self._shards[index]
+            if shard.get(key, _MISSING) is not expected:
+                return False
+            shard[key] = value
+            return True
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove key; return whether it was present"""
+        index = self._index(key)
+        with self._locks[index]:
+            if self._shards[index].pop(key, _MISSING) is _MISSING:
+                return False
+            self._index_remove(key)
+            return True
+
+    def items_after(self, after: Optional[Hashable], limit: int) -> List[Tuple[Hashable, Any]]:
+        """Up to ``limit`` pairs with key > ``after``, found by bisecting the key index"""
+        items: List[Tuple[Hashable, Any]] = []
+        while len(items) < limit:
+            wanted = limit - len(items)
+            with self._index_lock:
+                start = 0 if after is None else bisect.bisect_right(self._keys, after)
+                keys = self._keys[start:start + wanted]
+            for key in keys:
+                # a key deleted since the slice was taken is skipped
+                value = self._shards[self._index(key)].get(key, _MISSING)
+                if value is not _MISSING:
+                    items.append((key, value))
+            if len(keys) < wanted:
+                break
+            after = keys[-1]
+        return items
+
+    def iter_items(self, batch_size: int = 1000) -> Iterator[Tuple[Hashable, Any]]:
+        """Iterate over a per-shard snapshot of the (key, value) pairs, unordered"""
+        for index, shard in enumerate(self._shards):
+            with self._locks[index]:
+                snapshot = list(shard.items())
+            yield from snapshot
+
+    def values(self) -> Iterator[Any]:
+        """Iterate over a per-shard snapshot of the stored values"""
+        for index, shard in enumerate(self._shards):
+            with self._locks[index]:
+                snapshot = list(shard.values())
+            yield from snapshot
+
+    def clear(self) -> None:
+        """Remove everything"""
+        with ExitStack() as stack:
+            for lock in self._locks:
+                stack.enter_context(lock)
+            for shard in self._shards:
+                shard.clear()
+            with self._index_lock:
+                self._keys = []
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._shards[self._index(key)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+class _SQLiteFile:
+    """One SQLite file with a connection per thread; a forked child starts without any"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        _sqlite_files.add(self)
+
+    def _drop_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+# one fork hook for all files; a hook per instance would keep each alive forever
+_sqlite_files: 'weakref.WeakSet[_SQLiteFile]' = weakref.WeakSet()
+
+
+def _drop_sqlite_connections() -> None:
+    """SQLite connections must not be used across fork"""
+    for sqlite_file in list(_sqlite_files):
+        sqlite_file._drop_connections()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_drop_sqlite_connections)
+
+
+class SQLiteStore(_SQLiteFile, KeyValueStore):
+    """Store for integer keys and bytes values in one SQLite file.
+
+    Keys are 128-bit integers kept as 16-byte big-endian BLOBs, so the
+    primary key order is numeric order. Each thread gets its own connection,
+    and a forked child (e.g. a preloaded gunicorn worker) starts without any.
+    ``compare_and_set`` compares values by equality.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS users (id BLOB PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID"
+        )
+
+    @staticmethod
+    def _encode(key: int) -> bytes:
+        return key.to_bytes(16, 'big')
+
+    def get(self, key: int, default: Any = None) -> Any:
+        row = self._conn().execute(
+            "SELECT data FROM users WHERE id = ?", (self._encode(key),)).fetchone()
+        return row[0] if row else default
+
+    def put(self, key: int, value: bytes) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO users (id, data) VALUES (?, ?)", (self._encode(key), value))
+
+    def insert_if_absent(self, key: int, value: bytes) -> bool:
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO users (id, data) VALUES (?, ?)", (self._encode(key), value))
+        return cursor.rowcount == 1
+
+    def compare_and_set(self, key: int, expected: bytes, value: bytes) -> bool:
+        cursor = self._conn().execute(
+            "UPDATE users SET data = ? WHERE id = ? AND data = ?",
+            (value, self._encode(key), expected))
+        return cursor.rowcount == 1
+
+    def delete(self, key: int) -> bool:
+        cursor = self._conn().execute("DELETE FROM users WHERE id = ?", (self._encode(key),))
+        return cursor.rowcount == 1
+
+    def move_keys(self, keys: Sequence[int], target: KeyValueStore) -> int:
+        """Move ``keys`` to another SQLite file in one transaction.
+
+        The transaction holds the write locks of both files, so no other
+        process can write these keys between the read and the delete. A
+        concurrent delete therefore cannot be undone by the copy. In WAL mode
+        the files commit one after the other, main first. The transaction
+        therefore runs on the target's connection, so readers see the copy
+        before the delete.
+        """
+        if not isinstance(target, SQLiteStore):
+            return super().move_keys(keys, target)
+        conn = target._conn()
+        conn.execute("ATTACH DATABASE ? AS source", (self.path,))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                moved = 0
+                for key in keys:
+                    raw = self._encode(key)
+                    row = conn.execute("SELECT data FROM source.users WHERE id = ?", (raw,)).fetchone()
+                    if row is None:
+                        continue
+                    conn.execute("INSERT OR IGNORE INTO main.users (id, data) VALUES (?, ?)",
+                                 (raw, row[0]))
+                    conn.execute("DELETE FROM source.users WHERE id = ?", (raw,))
+                    moved += 1
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.execute("DETACH DATABASE source")
+        return moved
+
+    def items_after(self, after: Optional[int], limit: int) -> List[Tuple[int, bytes]]:
+        rows = self._conn().execute(
+            "SELECT id, data FROM users WHERE id > ? ORDER BY id LIMIT ?",
+            (self._encode(after) if after is not None else b'', limit))
+        return [(int.from_bytes(raw_id, 'big'), data) for raw_id, data in rows]
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM users")
+
+    def __contains__(self, key: int) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes"""
+
+    def __init__(self, nodes: Sequence[str], vnodes: int = 64):
+        points = []
+        for node in nodes:
+            for replica in range(vnodes):
+                points.append((self.hash(f"{node}#{replica}".encode()), node))
+        points.sort()
+        self._positions = [position for position, _ in points]
+        self._nodes = [node for _, node in points]
+        self.nodes = tuple(nodes)
+
+    @staticmethod
+    def hash(raw: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'big')
+
+    def node_for(self, key: Hashable) -> str:
+        """Node owning ``key``: the first ring point clockwise of its hash"""
+        raw = key.to_bytes(16, 'big') if isinstance(key, int) else str(key).encode()
+        index = bisect.bisect(self._positions, self.hash(raw)) % len(self._positions)
+        return self._nodes[index]
+
+
+class RingState(_SQLiteFile):
+    """Ring membership shared by every process through one SQLite file.
+
+    Holds the backend names and paths, the previous member names while keys
+    may still sit on their old owners, and a version bumped on every change.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS ring (id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "version INTEGER NOT NULL, nodes TEXT NOT NULL, previous TEXT)"
+        )
+
+    def version(self) -> int:
+        row = self._conn().execute("SELECT version FROM ring").fetchone()
+        return row[0] if row else 0
+
+    def load(self) -> Optional[Tuple[int, Dict[str, str], Optional[List[str]]]]:
+        """(version, {name: path}, previous names or None); None before initialize"""
+        row = self._conn().execute("SELECT version, nodes, previous FROM ring").fetchone()
+        if row is None:
+            return None
+        version, nodes, previous = row
+        return version, json.loads(nodes), json.loads(previous) if previous else None
+
+    def initialize(self, nodes: Dict[str, str]) -> None:
+        """Record ``nodes`` unless some process already did"""
+        self._conn().execute(
+            "INSERT OR IGNORE INTO ring (id, version, nodes, previous) VALUES (0, 1, ?, NULL)",
+            (json.dumps(nodes),))
+
+    def save(self, nodes: Dict[str, str], previous: Optional[List[str]]) -> int:
+        """Replace the membership and return the new version"""
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO ring (id, version, nodes, previous) VALUES (0, 1, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET version = version + 1, "
+            "nodes = excluded.nodes, previous = excluded.previous",
+            (json.dumps(nodes), json.dumps(previous) if previous is not None else None))
+        return self.version()
+
+
+class ConsistentHashStore(KeyValueStore):
+    """Routes each key to one of several backend stores via a consistent-hash ring.
+
+    Listing scatter-gathers across all backends and merges by key. Adding a
+    backend with ``add_backend`` migrates only the keys whose owner changed
+    while the store keeps serving. Writes hold a striped per-key lock and
+    move a migrating key before touching it. Reads check the old owner
+    before the new one and retry if the ring changed underneath them.
+
+    With a ``ring_state``, the membership is read from that shared file, at
+    most every ``refresh_interval`` seconds. Backends that another process
+    added are opened with ``open_backend(path)``. After ``add_backend`` the
+    previous ring stays in the shared state, so every process keeps falling
+    back to the old owners until ``cleanup`` has swept the stragglers.
+    """
+
+    def __init__(self, backends: Dict[str, KeyValueStore], vnodes: int = 64,
+                 ring_state: Optional[RingState] = None,
+                 open_backend: Callable[[str], KeyValueStore] = SQLiteStore,
+                 refresh_interval: float = 1.0):
+        if not backends:
+            raise ValueError("At least one backend is required")
+        self.backends = dict(backends)
+        self.vnodes = vnodes
+        self.ring_state = ring_state
+        self.open_backend = open_backend
+        self.refresh_interval = refresh_interval
+        # (current ring, previous ring while a rebalance is running), swapped as one
+        self._rings: Tuple[HashRing, Optional[HashRing]] = (HashRing(list(self.backends), vnodes), None)
+        self._move_locks = [threading.Lock() for _ in range(64)]
+        self._rebalance_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._ring_version = 0
+        self._checked_at = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=len(self.backends),
+                                            thread_name_prefix='store-gather')
+        if ring_state is not None:
+            ring_state.initialize({name: store.path for name, store in self.backends.items()})
+            self._refresh(force=True)
+
+    def _refresh(self, force: bool = False) -> None:
+        """Pick up membership changes made by other processes"""
+        if self.ring_state is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return
+        # one thread checks; the others carry on with the current rings
+        if not self._refresh_lock.acquire(blocking=force):
+            return
+        try:
+            self._checked_at = now
+            if self.ring_state.version() == self._ring_version:
+                return
+            version, nodes, previous = self.ring_state.load()
+            self._set_backends({name: self.backends[name] if name in self.backends
+                                else self.open_backend(path)
+                                for name, path in nodes.items()})
+            self._rings = (HashRing(list(nodes), self.vnodes),
+                           HashRing(previous, self.vnodes) if previous else None)
+            self._ring_version = version
+        finally:
+            self._refresh_lock.release()
+
+    def _set_backends(self, backends: Dict[str, KeyValueStore]) -> None:
+        # replaced, not mutated, so concurrent scatter-gathers keep a stable view
+        resized = len(backends) != len(self.backends)
+        self.backends = backends
+        if resized:
+            previous_executor = self._executor
+            self._executor = ThreadPoolExecutor(max_workers=len(backends),
+                                                thread_name_prefix='store-gather')
+            previous_executor.shutdown(wait=False)
+
+    def _publish(self, previous: Optional[List[str]]) -> None:
+        if self.ring_state is not None:
+            self._ring_version = self.ring_state.save(
+                {name: store.path for name, store in self.backends.items()}, previous)
+
+    def backend_for(self, key: Hashable) -> KeyValueStore:
+        self._refresh()
+        return self.backends[self._rings[0].node_for(key)]
+
+    def _owners(self, rings: Tuple[HashRing, Optional[HashRing]],
+                key: Hashable) -> Tuple[KeyValueStore, Optional[KeyValueStore]]:
+        """(owner, previous owner if the key is being moved) under ``rings``"""
+        ring, previous = rings
+        node = ring.node_for(key)
+        if previous is not None:
+            old_node = previous.node_for(key)
+            if old_node != node:
+                return self.backends[node], self.backends[old_node]
+        return self.backends[node], None
+
+    def _move_lock(self, key: Hashable) -> threading.Lock:
+        return self._move_locks[hash(key) % len(self._move_locks)]
+
+    @contextmanager
+    def _move_locks_for(self, keys: Sequence[Hashable]) -> Iterator[None]:
+        # always taken in index order, so two sweeps cannot deadlock
+        indexes = sorted({hash(key) % len(self._move_locks) for key in keys})
+        with ExitStack() as stack:
+            for index in indexes:
+                stack.enter_context(self._move_locks[index])
+            yield
+
+    def _move_key(self, key: Hashable, source: KeyValueStore, target: KeyValueStore) -> bool:
+        """Move key to its new owner; caller holds the move lock.
+
+        The lock only covers this process. Between SQLite files the move is
+        one transaction, which keeps it safe against other processes.
+        """
+        return source.move_keys([key], target) == 1
+
+    def _write(self, key: Hashable, operation: Callable[[KeyValueStore], Any]) -> Any:
+        self._refresh()
+        with self._move_lock(key):
+            target, source = self._owners(self._rings, key)
+            if source is not None:
+                self._move_key(key, source, target)
+            return operation(target)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        self._refresh()
+        while True:
+            rings = self._rings
+            target, source = self._owners(rings, key)
+            if source is not None:
+                # old owner first: a move inserts into the target before
+                # deleting from the source
+                value = source.get(key)
+                if value is not None:
+                    return value
+            value = target.get(key)
+            if value is not None:
+                return value
+            if rings is self._rings:
+                return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._write(key, lambda store: store.put(key, value))
+
+    def insert_if_absent(self, key: Hashable, value: Any) -> bool:
+        return self._write(key, lambda store: store.insert_if_absent(key, value))
+
+    def compare_and_set(self, key: Hashable, expected: Any, value: Any) -> bool:
+        return self._write(key, lambda store: store.compare_and_set(key, expected, value))
+
+    def delete(self, key: Hashable) -> bool:
+        return self._write(key, lambda store: store.delete(key))
+
+    def items_after(self, after: Optional[Hashable], limit: int) -> List[Tuple[Hashable, Any]]:
+        """Scatter the query to every backend in parallel and merge the sorted results"""
+        self._refresh()
+        futures = [self._executor.submit(store.items_after, after, limit)
+                   for store in self.backends.values()]
+        merged = heapq.merge(*(future.result() for future in futures), key=itemgetter(0))
+        items: List[Tuple[Hashable, Any]] = []
+        last_key = _MISSING
+        for key, value in merged:
+            # a key being moved can briefly exist on two backends
+            if key == last_key:
+                continue
+            items.append((key, value))
+            last_key = key
+            if len(items) == limit:
+                break
+        return items
+
+    def add_backend(self, name: str, store: KeyValueStore, batch_size: int = 1000) -> int:
+        """Add a backend and move the keys it now owns; returns the number moved"""
+        with self._rebalance_lock:
+            old_nodes = self._begin_add(name, store)
+            if self.ring_state is not None:
+                # keys may only move once every process routes with both rings
+                time.sleep(2 * self.refresh_interval)
+
+            # the second sweep picks up writes that were routed with the old
+            # ring while the first sweep was running
+            moved = self._sweep(old_nodes, batch_size) + self._sweep(old_nodes, batch_size)
+            if self.ring_state is None:
+                self._rings = (self._rings[0], None)
+            return moved
+
+    def _begin_add(self, name: str, store: KeyValueStore) -> List[str]:
+        """Route with the new and the previous ring; returns the previous nodes"""
+        self._refresh(force=True)
+        if name in self.backends:
+            raise ValueError(f"Backend {name!r} already exists")
+        if self._rings[1] is not None:
+            raise ValueError("The previous rebalance has not been cleaned up")
+        old_nodes = list(self._rings[0].nodes)
+        self._set_backends({**self.backends, name: store})
+        self._rings = (HashRing(old_nodes + [name], self.vnodes), self._rings[0])
+        self._publish(old_nodes)
+        return old_nodes
+
+    def cleanup(self, batch_size: int = 1000) -> int:
+        """Move any key not on its owner, then stop falling back to old owners.
+
+        Run after ``add_backend`` once requests routed with an older ring
+        have finished, e.g. after the workers restarted; returns the number
+        of keys moved.
+        """
+        with self._rebalance_lock:
+            self._refresh(force=True)
+            moved = self._sweep(list(self._rings[0].nodes), batch_size)
+            self._rings = (self._rings[0], None)
+            self._publish(None)
+            return moved
+
+    def _sweep(self, nodes: Sequence[str], batch_size: int) -> int:
+        ring = self._rings[0]
+        moved = 0
+        for node in nodes:
+            source = self.backends[node]
+            items = source.iter_items(batch_size)
+            while True:
+                batch = list(itertools.islice(items, batch_size))
+                if not batch:
+                    break
+                misplaced: Dict[str, List[Hashable]] = {}
+                for key, _value in batch:
+                    owner = ring.node_for(key)
+                    if owner != node:
+                        misplaced.setdefault(owner, []).append(key)
+                for owner, keys in misplaced.items():
+                    with self._move_locks_for(keys):
+                        moved += source.move_keys(keys, self.backends[owner])
+        return moved
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        self._refresh()
+        return sum(len(store) for store in self.backends.values())
+
+
+def default_ring_path(shard_paths: Sequence[str]) -> str:
+    """Ring state file next to the first shard"""
+    return os.path.join(os.path.dirname(shard_paths[0]), 'ring.db')
+
+
+def build_user_store(shard_paths: Sequence[str], ring_path: Optional[str] = None) -> KeyValueStore:
+    """In-memory store by default, or a consistent-hash ring over SQLite shard files.
+
+    The ring membership is shared through ``ring_path`` (next to the first
+    shard by default), so every process sees shards added by rebalance.py.
+    """
+    if not shard_paths:
+        return ShardedStore()
+    backends = {os.path.basename(path): SQLiteStore(path) for path in shard_paths}
+    return ConsistentHashStore(backends,
+                               ring_state=RingState(ring_path or default_ring_path(shard_paths)))
@@ -1,15 +1,142 @@
 """
 Utility functions for the application
 """
+import atexit
+import copy
 import datetime
+import itertools
 import json
 import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+import weakref
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict, Any, Optional
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_log_listener: Optional[QueueListener] = None
+_log_handler: Optional["DroppingQueueHandler"] = None
+_log_sample_rates: Dict[str, float] = {}
+_log_settings: Optional[tuple] = None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that never blocks the caller; records are dropped when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge the args into the message on the caller's thread.
+
+        The caller may mutate its args right after logging; merging now keeps
+        the record as it was. Formatting and I/O stay on the listener thread.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Put record on the queue without waiting"""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if hasattr(record, "operation"):
+            payload["operation"] = record.operation
+            payload["details"] = record.details
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Format string output, followed by the JSON details of log_operation records"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if hasattr(record, "operation"):
+            text += " " + json.dumps(record.details, default=str)
+        return text
+
+
+def configure_logging(level: str = "INFO", log_format: str = logging.BASIC_FORMAT,
+                      queue_size: int = 10000,
+                      sample_rates: Optional[Dict[str, float]] = None) -> DroppingQueueHandler:
+    """Route root logging through a bounded queue drained by a listener thread.
+
+    ``log_format`` is either ``"json"`` or a ``logging.Formatter`` format string.
+    """
+    global _log_listener, _log_handler, _log_sample_rates, _log_settings
+
+    _log_settings = (level, log_format, queue_size, sample_rates)
+    if _log_listener is not None:
+        _log_listener.stop()
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    output = logging.StreamHandler()
+    if log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(TextFormatter(log_format))
+
+    root = logging.getLogger()
+    if _log_handler is not None:
+        root.removeHandler(_log_handler)
+    _log_handler = DroppingQueueHandler(log_queue)
+    root.addHandler(_log_handler)
+    root.setLevel(level)
+
+    _log_listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _log_listener.start()
+    _log_sample_rates = dict(sample_rates or {})
+    return _log_handler
+
+
+def get_dropped_log_count() -> int:
+    """Number of log records dropped because the queue was full"""
+    return _log_handler.dropped if _log_handler is not None else 0
+
+
+def _restart_log_listener() -> None:
+    """The listener thread does not survive fork (preloaded gunicorn workers); start a new one"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener = None
+        configure_logging(*_log_settings)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_log_listener)
+
+
+@atexit.register
+def _stop_log_listener() -> None:
+    """Flush queued records on interpreter exit"""
+    if _log_listener is not None:
+        _log_listener.stop()
+
 
 def get_current_timestamp() -> str:
     """Get current timestamp in ISO format"""
@@ -61,16 +188,109 @@ def validate_email(email: str) -> bool:
 
 
 def log_operation(operation: str, details: Optional[Dict[str, Any]] = None) -> None:
-    """Log operation for monitoring"""
-    log_data = {
-        "operation": operation,
-        "timestamp": get_current_timestamp(),
-        "details": details or {}
-    }
-    logger.info(f"Operation logged: {json.dumps(log_data)}")
+    """Log operation for monitoring, subject to the operation's sample rate"""
+    rate = _log_sample_rates.get(operation, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    # a shallow copy, so the caller can keep using its dict; it is
+    # serialized later, on the listener thread
+    logger.info("Operation logged: %s", operation,
+                extra={"operation": operation, "details": dict(details or {})})
 
 
 def generate_id() -> str:
     """Generate unique ID"""
     import uuid
-    return str(uuid.uuid4()) 
\ No newline at end of file
+    return str(uuid.uuid4())
+
+
+class IdGenerator:
+    """Time-ordered, collision-free ID generator (ULID-style layout).
+
+    An ID packs 48 bits of Unix milliseconds, a 24-bit worker id and a 56-bit
+    per-process sequence into 128 bits. It is encoded as 32 lowercase hex
+    characters, so string order matches numeric order. The sequence alone
+    makes IDs unique within a process and the worker id separates processes.
+    ``next(itertools.count())`` is atomic under the GIL, so the hot path
+    takes no lock. Forked children pick a new worker id and sequence.
+
+    With ``host_id`` (0-255, e.g. from WORKER_ID) the worker id is the host
+    id plus the pid, which is unique across hosts that are numbered
+    distinctly. Without one, it is 24 random bits. Containers tend to share
+    pids, so pids cannot be relied on across hosts. Each sequence also
+    starts at a random offset. Two processes that draw the same worker id
+    then still collide only on the same millisecond with overlapping
+    sequence ranges.
+    """
+
+    WORKER_BITS = 24
+    SEQUENCE_BITS = 56
+    TIMESTAMP_SHIFT = WORKER_BITS + SEQUENCE_BITS
+    SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+    # leaves 2**56 - 2**48 IDs per process before the sequence wraps
+    SEQUENCE_START_BITS = 48
+
+    def __init__(self, worker_id: Optional[int] = None, host_id: Optional[int] = None):
+        self._fixed_worker_id = worker_id
+        self._host_id = host_id
+        self._reset()
+        _id_generators.add(self)
+
+    def _reset(self) -> None:
+        """Start a fresh sequence, e.g. after fork"""
+        worker_id = self._fixed_worker_id
+        if worker_id is None:
+            if self._host_id is not None:
+                # pids are unique per host at any moment
+                worker_id = ((self._host_id & 0xFF) << 16) | (os.getpid() & 0xFFFF)
+            else:
+                worker_id = secrets.randbits(self.WORKER_BITS)
+        self.worker_id = worker_id & ((1 << self.WORKER_BITS) - 1)
+        self._sequence = itertools.count(secrets.randbits(self.SEQUENCE_START_BITS))
+        # wall clock anchored to a monotonic clock, so IDs never go backwards
+        self._epoch_ms = time.time_ns() // 1_000_000
+        self._monotonic_start = time.monotonic_ns()
+        self._worker_prefix = self.worker_id << self.SEQUENCE_BITS
+
+    def next_int(self) -> int:
+        """Next ID as a 128-bit integer"""
+        sequence = next(self._sequence)
+        millis = self._epoch_ms + (time.monotonic_ns() - self._monotonic_start) // 1_000_000
+        return (millis << self.TIMESTAMP_SHIFT) | self._worker_prefix | (sequence & self.SEQUENCE_MASK)
+
+    def next_id(self) -> str:
+        """Next ID as a sortable 32-character hex string"""
+        return self.format(self.next_int())
+
+    @staticmethod
+    def format(id_int: int) -> str:
+        """String form of an integer ID"""
+        return f"{id_int:032x}"
+
+    @staticmethod
+    def millis_of(id_int: int) -> int:
+        """Unix milliseconds encoded in an integer ID"""
+        return id_int >> IdGenerator.TIMESTAMP_SHIFT
+
+    @staticmethod
+    def timestamp_of(id_value: str) -> datetime.datetime:
+        """Creation time encoded in an ID"""
+        millis = IdGenerator.millis_of(int(id_value, 16))
+        return datetime.datetime.fromtimestamp(millis / 1000)
+
+
+# one fork hook for all generators; a hook per instance would keep each alive forever
+_id_generators: 'weakref.WeakSet[IdGenerator]' = weakref.WeakSet()
+
+
+def _reset_id_generators() -> None:
+    """Forked children must not repeat the parent's IDs"""
+    for generator in list(_id_generators):
+        generator._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_id_generators)
@@ -0,0 +1,68 @@
+"""
+Encode/decode CPU and wire size of each registered codec on representative payloads
+
+Usage: python benchmarks/bench_codecs.py [iterations]
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+from app.codecs import CODECS
+from app.services import DataService, UserService
+from app.sketches import PayloadStats
+
+
+def payloads():
+    """Bodies as the user, process and analytics routes produce or accept them"""
+    users = UserService()
+    for i in range(50):
+        users.create_user(f"user{i}", f"user{i}@example.com")
+    user_page = users.list_users(limit=50)
+
+    order = {
+        "order_id": 918273, "customer": "user17", "currency": "EUR", "paid": True,
+        "total": 129.95, "tags": ["express", "gift"],
+        "items": [{"sku": f"SKU-{i:05d}", "quantity": i % 4 + 1, "price": 9.99 + i} for i in range(20)]
+    }
+    processed = DataService().process_data(order)
+
+    stats = PayloadStats()
+    for i in range(2000):
+        body = {"kind": ["view", "buy", "cart"][i % 3], "user": f"u{i % 300}", "n": i}
+        raw = json.dumps(body, sort_keys=True)
+        stats.observe(body, len(raw), hashlib.sha256(raw.encode()).hexdigest())
+
+    return {
+        'user': user_page['items'][0],
+        'user page (50)': user_page,
+        'process result': processed,
+        'payload summary': stats.summary(),
+        'payload sketch': stats.to_dict(),
+    }
+
+
+def measure(codec, data, iterations: int):
+    """(encode us, decode us, bytes) averaged over ``iterations``"""
+    encoded = codec.encode(data)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        codec.encode(data)
+    encode_us = (time.perf_counter() - started) / iterations * 1e6
+    started = time.perf_counter()
+    for _ in range(iterations):
+        codec.decode(encoded)
+    decode_us = (time.perf_counter() - started) / iterations * 1e6
+    return encode_us, decode_us, len(encoded)
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'payload':<17} {'codec':<20} {'encode us':>10} {'decode us':>10} {'bytes':>8}")
+    for name, data in payloads().items():
+        for media_type, codec in CODECS.items():
+            encode_us, decode_us, size = measure(codec, data, iterations)
+            print(f"{name:<17} {media_type:<20} {encode_us:10.1f} {decode_us:10.1f} {size:8d}")
@@ -0,0 +1,47 @@
+"""
+Benchmark user ID generation throughput
+
+Usage: python benchmarks/bench_ids.py [count] [threads]
+"""
+import hashlib
+import os
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+from app.utils import IdGenerator
+
+
+def legacy_id() -> str:
+    """The previous truncated-MD5 user ID, for comparison"""
+    return hashlib.md5(f"{datetime.now()}{secrets.token_hex(8)}".encode()).hexdigest()[:8]
+
+
+def run(generate, count: int, threads: int) -> float:
+    """Generate ``count`` IDs split over ``threads`` threads; return IDs/sec"""
+    per_thread = count // threads
+
+    def worker():
+        for _ in range(per_thread):
+            generate()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    generator = IdGenerator()
+    print(f"IdGenerator.next_id  {run(generator.next_id, count, threads):>12,.0f} ids/s")
+    print(f"IdGenerator.next_int {run(generator.next_int, count, threads):>12,.0f} ids/s")
+    print(f"legacy md5[:8]       {run(legacy_id, count, threads):>12,.0f} ids/s")
@@ -0,0 +1,60 @@
+"""
+Memory per user: legacy dict records vs packed UserService records
+
+Usage: python benchmarks/bench_user_memory.py [users]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+from app.services import UserService
+from app.utils import IdGenerator
+
+
+def legacy_users(count: int):
+    """The previous representation: one dict per user keyed by ID string"""
+    generator = IdGenerator()
+    users = {}
+    for i in range(count):
+        user_id = generator.next_id()
+        users[user_id] = {
+            'id': user_id,
+            'username': f"user{i}",
+            'email': f"user{i}@example.com",
+            'created_at': datetime.now().isoformat(),
+            'status': 'active'
+        }
+    return users
+
+
+def packed_users(count: int):
+    service = UserService()
+    for i in range(count):
+        service.create_user(f"user{i}", f"user{i}@example.com")
+    return service
+
+
+def measure(build, count: int) -> float:
+    """Bytes allocated per user while the collection is alive"""
+    gc.collect()
+    tracemalloc.start()
+    collection = build(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del collection
+    gc.collect()
+    return current / count
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    legacy = measure(legacy_users, count)
+    packed = measure(packed_users, count)
+    print(f"users:  {count:,}")
+    print(f"legacy: {legacy:8.1f} bytes/user  {legacy * count / 2**20:10.1f} MiB")
+    print(f"packed: {packed:8.1f} bytes/user  {packed * count / 2**20:10.1f} MiB")
+    print(f"ratio:  {legacy / packed:8.2f}x")
@@ -0,0 +1,59 @@
+"""
+Contention benchmark for the in-memory user store
+
+Usage: python benchmarks/bench_user_store.py [operations] [max_threads]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+from app.services import UserService
+from app.storage import ShardedStore
+
+
+class GlobalLockStore(ShardedStore):
+    """Baseline: the same API behind one lock for everything"""
+
+    def __init__(self):
+        super().__init__(shards=1)
+
+
+def run(store_factory, operations: int, threads: int) -> float:
+    """Mixed 80% read / 20% update workload; return operations/sec"""
+    service = UserService()
+    service.users = store_factory()
+    user_ids = [service.create_user(f"user{i}", f"user{i}@example.com")['id'] for i in range(10000)]
+    per_thread = operations // threads
+
+    def worker(offset):
+        for i in range(per_thread):
+            user_id = user_ids[(offset + i * 7) % len(user_ids)]
+            if i % 5 == 0:
+                service.update_user(user_id, status='active')
+            else:
+                service.get_user(user_id)
+
+    workers = [threading.Thread(target=worker, args=(n * 1000,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 400000
+    max_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"GIL enabled: {gil}")
+    print(f"{'threads':>7} {'global lock':>14} {'16 shards':>14}")
+    threads = 1
+    while threads <= max_threads:
+        single = run(GlobalLockStore, operations, threads)
+        sharded = run(lambda: ShardedStore(shards=16), operations, threads)
+        print(f"{threads:>7} {single:>12,.0f}/s {sharded:>12,.0f}/s")
+        threads *= 2
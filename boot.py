@@ -0,0 +1,122 @@
+"""
+Boot the web process: migrate if behind, seed if empty, then serve.
+
+Replaces ``flask db upgrade; python seed.py; gunicorn app:app``, which
+imported the app and opened the database once per step. Here the app is
+imported once, an up-to-date database costs one query for the migration
+check and one for the seed check, and gunicorn serves the already imported
+app (workers fork from it, as with ``--preload``).
+
+Arguments after the boot options are passed to gunicorn, e.g.
+``python boot.py --workers 3``; GUNICORN_CMD_ARGS is honoured as usual.
+"""
+import argparse
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+boot_started = time.perf_counter()
+
+from alembic.script import ScriptDirectory
+from flask import current_app
+from flask_migrate import upgrade
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from app import app, db
+from app.config import Config
+from app.utils import configure_logging
+from seed import Seeder
+
+import_seconds = time.perf_counter() - boot_started
+logger = logging.getLogger('boot')
+
+
+@contextmanager
+def phase(name):
+    """Log how long one boot phase took"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info("boot phase %s took %.1f ms", name, (time.perf_counter() - started) * 1000)
+
+
+def current_revisions(engine):
+    """Revisions recorded in alembic_version; empty when the table does not exist yet"""
+    try:
+        with engine.connect() as connection:
+            return {row[0] for row in connection.execute(text('SELECT version_num FROM alembic_version'))}
+    except (OperationalError, ProgrammingError):
+        return set()
+
+
+def head_revisions():
+    """Head revisions of the migration scripts, read from disk without touching the database"""
+    config = current_app.extensions['migrate'].migrate.get_config()
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+def migrate_if_needed():
+    """Upgrade to head unless the database is already there; returns whether it ran"""
+    if current_revisions(db.engine) == head_revisions():
+        return False
+    upgrade()
+    # env.py loads alembic.ini's logging config; put the app's back
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    configure_logging(Config.LOG_LEVEL, Config.LOG_FORMAT, Config.LOG_QUEUE_SIZE, Config.LOG_SAMPLE_RATES)
+    return True
+
+
+def prepare(skip_migrate=False, skip_seed=False):
+    """Run the pre-serve phases inside an app context"""
+    with app.app_context():
+        if not skip_migrate:
+            with phase('migrate'):
+                logger.info("migrations %s", "applied" if migrate_if_needed() else "already at head")
+        if not skip_seed:
+            with phase('seed'):
+                # a single SELECT when there is already data
+                Seeder().populate_database()
+        # connections must not be shared with the forked workers
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def serve(gunicorn_args):
+    """Hand the imported app to gunicorn in this process"""
+    from gunicorn.app.base import Application
+
+    class BootedApplication(Application):
+        def init(self, parser, opts, args):
+            return None
+
+        def load(self):
+            return app
+
+    sys.argv = [sys.argv[0]] + gunicorn_args
+    BootedApplication().run()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate, seed and serve the app",
+                                     epilog="Other arguments are passed to gunicorn.")
+    parser.add_argument("--skip-migrate", action="store_true",
+                        help="do not check or apply migrations")
+    parser.add_argument("--skip-seed", action="store_true",
+                        help="do not check or seed data")
+    parser.add_argument("--no-serve", action="store_true",
+                        help="exit after migrating and seeding")
+    return parser.parse_known_args(argv)
+
+
+if __name__ == '__main__':
+    args, gunicorn_args = parse_args()
+    logger.info("boot phase import took %.1f ms", import_seconds * 1000)
+    prepare(skip_migrate=args.skip_migrate, skip_seed=args.skip_seed)
+    logger.info("boot ready to serve after %.1f ms", (time.perf_counter() - boot_started) * 1000)
+    if not args.no_serve:
+        serve(gunicorn_args)
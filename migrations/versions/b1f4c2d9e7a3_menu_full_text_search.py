@@ -0,0 +1,47 @@
+"""menu full-text search
+
+Revision ID: b1f4c2d9e7a3
+Revises: 461de817e3d2
+Create Date: 2026-10-19 10:12:44.318205
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1f4c2d9e7a3'
+down_revision = '461de817e3d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE menu_fts USING fts5("
+                   "name, content='menu', content_rowid='id', prefix='2 3')")
+        op.execute("CREATE TRIGGER menu_fts_ai AFTER INSERT ON menu BEGIN "
+                   "INSERT INTO menu_fts(rowid, name) VALUES (new.id, new.name); END")
+        op.execute("CREATE TRIGGER menu_fts_ad AFTER DELETE ON menu BEGIN "
+                   "INSERT INTO menu_fts(menu_fts, rowid, name) "
+                   "VALUES ('delete', old.id, old.name); END")
+        op.execute("CREATE TRIGGER menu_fts_au AFTER UPDATE ON menu BEGIN "
+                   "INSERT INTO menu_fts(menu_fts, rowid, name) "
+                   "VALUES ('delete', old.id, old.name); "
+                   "INSERT INTO menu_fts(rowid, name) VALUES (new.id, new.name); END")
+        # index rows that existed before the triggers
+        op.execute("INSERT INTO menu_fts(menu_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute("CREATE INDEX ix_menu_name_fts ON menu "
+                   "USING gin (to_tsvector('simple', coalesce(name, '')))")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS menu_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS menu_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS menu_fts_ai")
+        op.execute("DROP TABLE IF EXISTS menu_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_menu_name_fts")
@@ -0,0 +1,48 @@
+"""
+Add a SQLite shard to the user store and move the users it now owns.
+
+Usage: python rebalance.py --shards a.db b.db --add c.db
+       python rebalance.py --shards a.db b.db --cleanup
+
+Shard names on the hash ring are the file names, matching USER_STORE_SHARDS.
+The new shard is recorded in the shared ring state (USER_STORE_RING), so
+running workers start using it within a second, without a restart. Until
+``--cleanup`` runs they also check the previous owner of every moved user.
+Run it once requests that started before the move have finished, e.g. after
+the next restart, and add the new file to USER_STORE_SHARDS.
+"""
+import argparse
+import os
+import time
+
+from app.storage import SQLiteStore, build_user_store
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Add a shard to the user store")
+    parser.add_argument("--shards", nargs="+", required=True,
+                        help="current shard files, as in USER_STORE_SHARDS")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--add", help="shard file to add")
+    action.add_argument("--cleanup", action="store_true",
+                        help="move leftover users and stop checking previous owners")
+    parser.add_argument("--ring", default=os.environ.get('USER_STORE_RING'),
+                        help="shared ring state file, as in USER_STORE_RING")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="keys read per batch while scanning a shard")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    store = build_user_store(args.shards, args.ring)
+    started = time.monotonic()
+    if args.cleanup:
+        moved = store.cleanup(batch_size=args.batch_size)
+        print("Moved {} leftover users in {:.1f}s.".format(moved, time.monotonic() - started))
+    else:
+        moved = store.add_backend(os.path.basename(args.add), SQLiteStore(args.add),
+                                  batch_size=args.batch_size)
+        print("Moved {} users to {} in {:.1f}s.".format(moved, args.add, time.monotonic() - started))
+    for name, shard in store.backends.items():
+        print("  {}: {} users".format(name, len(shard)))
@@ -1,16 +1,130 @@
+import argparse
+import sys
+import time
+
+from app import app
 from app import db
 from app.models import Menu
+from app.replicas import pin_to_primary
+
+ADJECTIVES = [
+    "Baked", "Grilled", "Roasted", "Smoked", "Fried", "Steamed", "Braised",
+    "Spicy", "Crispy", "Creamy", "Stuffed", "Glazed", "Pickled", "Seared",
+]
+DISHES = [
+    "potatoes", "chicken", "salmon", "tofu", "mushrooms", "dumplings",
+    "noodles", "risotto", "lentils", "cauliflower", "ribs", "tacos",
+    "eggplant", "gnocchi", "pork belly", "halloumi",
+]
+
+MASK_64 = (1 << 64) - 1
+
+
+def _mix(seed, index):
+    """Deterministic 64-bit hash of (seed, index) (splitmix64 finalizer)"""
+    x = (seed * 0x9E3779B97F4A7C15 + index + 1) & MASK_64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return x ^ (x >> 31)
+
+
+def synthetic_menu_name(seed, index):
+    """Name of the synthetic menu row at ``index``; independent of other rows"""
+    x = _mix(seed, index)
+    adjective = ADJECTIVES[x % len(ADJECTIVES)]
+    dish = DISHES[(x >> 16) % len(DISHES)]
+    return "{} {} #{}".format(adjective, dish, index)
+
 
 class Seeder(object):
     def populate_database(self):
+        # a lagging replica must not make us seed twice
+        pin_to_primary(db.session)
         record = Menu.query.first()
         if not record:
             new_record = Menu(name="Baked potatoes")
             db.session.add(new_record)
             db.session.commit()
 
+    def populate_menu(self, total, seed=0, chunk_size=10000, progress=None):
+        """Grow the menu table to ``total`` rows of synthetic data.
+
+        Rows are written with chunked Core ``INSERT``s, one transaction per
+        chunk, bypassing the ORM session. Every row is derived from
+        ``(seed, index)`` only, so an interrupted run resumes after the last
+        synthetic row written and produces the same data as an uninterrupted
+        one. Other rows (e.g. the default seed) and deleted synthetic rows
+        below the last one do not shift the indices.
+        Returns the number of rows inserted.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+
+        table = Menu.__table__
+        pin_to_primary(db.session)
+        start = self._next_synthetic_index(seed)
+        db.session.remove()
+
+        inserted = 0
+        for chunk_start in range(start, total, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, total)
+            rows = [
+                {"name": synthetic_menu_name(seed, index)}
+                for index in range(chunk_start, chunk_end)
+            ]
+            with db.engine.begin() as connection:
+                connection.execute(table.insert(), rows)
+            inserted += len(rows)
+            if progress:
+                progress(chunk_end, total)
+        return inserted
+
+    @staticmethod
+    def _next_synthetic_index(seed):
+        """Index after the newest synthetic row; scans back from the highest id"""
+        last = (db.session.query(Menu.name)
+                .filter(Menu.name.like('% #%'))
+                .order_by(Menu.id.desc())
+                .first())
+        if last is None:
+            return 0
+        try:
+            index = int(last.name.rsplit(' #', 1)[1])
+        except ValueError:
+            return 0
+        if synthetic_menu_name(seed, index) != last.name:
+            raise ValueError("The menu already holds synthetic rows from a different seed")
+        return index + 1
+
+
+def print_progress(done, total, started):
+    elapsed = max(time.monotonic() - started, 1e-9)
+    sys.stdout.write("\r{}/{} rows ({:.0f} rows/s)".format(done, total, done / elapsed))
+    sys.stdout.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed the database")
+    parser.add_argument("--menu-rows", type=int, default=0,
+                        help="grow the menu table to this many synthetic rows")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed for deterministic synthetic data")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="rows per INSERT transaction")
+    return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
+    args = parse_args()
     print("Seeding...")
     seeder = Seeder()
-    seeder.populate_database()
+    with app.app_context():
+        if args.menu_rows:
+            started = time.monotonic()
+            inserted = seeder.populate_menu(
+                args.menu_rows, seed=args.seed, chunk_size=args.chunk_size,
+                progress=lambda done, total: print_progress(done, total, started))
+            print("\nInserted {} menu rows.".format(inserted))
+        else:
+            seeder.populate_database()
     print("Seeding complete.")
@@ -0,0 +1,46 @@
+import unittest
+
+from sqlalchemy import text
+
+from app import app, db
+from app.models import Menu
+from boot import current_revisions, head_revisions, migrate_if_needed, parse_args, prepare
+
+
+class BootTests(unittest.TestCase):
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self._reset()
+
+    def tearDown(self):
+        self._reset()
+
+    @staticmethod
+    def _reset():
+        with app.app_context():
+            db.drop_all()
+            with db.engine.begin() as connection:
+                connection.execute(text('DROP TABLE IF EXISTS alembic_version'))
+
+    def test_migrates_only_when_behind(self):
+        with app.app_context():
+            self.assertEqual(current_revisions(db.engine), set())
+            self.assertTrue(migrate_if_needed())
+            self.assertEqual(current_revisions(db.engine), head_revisions())
+            self.assertFalse(migrate_if_needed())
+
+    def test_prepare_migrates_and_seeds(self):
+        prepare()
+        prepare()
+        with app.app_context():
+            self.assertEqual(Menu.query.count(), 1)
+
+    def test_unknown_arguments_go_to_gunicorn(self):
+        args, rest = parse_args(['--no-serve', '--workers', '3'])
+        self.assertTrue(args.no_serve)
+        self.assertEqual(rest, ['--workers', '3'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Tests for body codecs and content negotiation
+"""
+import json
+import unittest
+
+import msgpack
+
+from app import app
+from app.codecs import CODECS, Codec, JsonCodec, PayloadTooComplex, check_object_limits
+
+MSGPACK = 'application/msgpack'
+
+
+class TestCodecs(unittest.TestCase):
+    """Test codecs directly"""
+
+    def test_json_round_trip_and_limits(self):
+        codec = JsonCodec()
+        payload = {"a": [1, 2, {"b": None}], "c": "é"}
+        self.assertEqual(codec.decode(codec.encode(payload), 8, 8), payload)
+        with self.assertRaises(PayloadTooComplex):
+            codec.decode(b'[[[[1]]]]', 3, 8)
+        with self.assertRaises(ValueError):
+            codec.decode(b'{"a":', 8, 8)
+
+    def test_incomplete_codec_cannot_be_created(self):
+        class EncodeOnly(Codec):
+            def encode(self, data):
+                return b''
+
+        with self.assertRaises(TypeError):
+            EncodeOnly()
+
+    def test_object_limits(self):
+        check_object_limits({"a": [{"b": 1}]}, 3, 2)
+        with self.assertRaises(PayloadTooComplex):
+            check_object_limits({"a": [{"b": 1}]}, 2, 10)
+        with self.assertRaises(PayloadTooComplex):
+            check_object_limits([{"a": 1}, {"b": 2, "c": 3}], 10, 2)
+
+    def test_msgpack_round_trip(self):
+        codec = CODECS[MSGPACK]
+        payload = {"a": [1, 2.5, True, None], "b": {"c": "text"}}
+        encoded = codec.encode(payload)
+        self.assertLess(len(encoded), len(json.dumps(payload)))
+        self.assertEqual(codec.decode(encoded, 8, 8), payload)
+        with self.assertRaises(ValueError):
+            codec.decode(b'\xc1', 8, 8)
+        with self.assertRaises(PayloadTooComplex):
+            codec.decode(codec.encode([[[[1]]]]), 3, 8)
+
+    def test_msgpack_rejects_non_json_values(self):
+        codec = CODECS[MSGPACK]
+        for value in ({1: "a"}, {b"k": 1}, {"a": b"raw"}, [msgpack.ExtType(5, b"x")],
+                      {"t": msgpack.Timestamp(1, 0)}):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                codec.decode(msgpack.packb(value, use_bin_type=True), 8, 8)
+
+
+class TestNegotiation(unittest.TestCase):
+    """Test Accept/Content-Type negotiation on the routes"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+
+    def test_json_is_default(self):
+        response = self.app.get('/api/v1/analytics', headers={'Accept': 'text/html'})
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertIn('Accept', response.headers['Vary'])
+
+    def test_unsupported_content_type(self):
+        response = self.app.post('/api/v1/process', data='a=1',
+                                 content_type='application/x-www-form-urlencoded')
+        self.assertEqual(response.status_code, 415)
+        self.assertIn('application/json', response.get_json()['supported'])
+
+    def test_msgpack_request_and_response(self):
+        body = msgpack.packb({"username": "packed", "email": "packed@example.com"})
+        response = self.app.post('/api/v1/users', data=body, content_type=MSGPACK,
+                                 headers={'Accept': MSGPACK})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.mimetype, MSGPACK)
+        user = msgpack.unpackb(response.data)['data']
+        self.assertEqual(user['username'], "packed")
+
+        # clients that do not ask for MessagePack still get JSON
+        response = self.app.get(f"/api/v1/users/{user['id']}")
+        self.assertEqual(response.get_json()['email'], "packed@example.com")
+
+    def test_msgpack_binary_payload_is_bad_request(self):
+        for value in ({"a": b"raw"}, {1: "a"}):
+            response = self.app.post('/api/v1/process', data=msgpack.packb(value, use_bin_type=True),
+                                     content_type=MSGPACK)
+            self.assertEqual(response.status_code, 400)
+
+    def test_msgpack_errors_are_negotiated(self):
+        response = self.app.post('/api/v1/process', data=msgpack.packb([1, 2]),
+                                 content_type=MSGPACK, headers={'Accept': MSGPACK})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(msgpack.unpackb(response.data)['error'], "Invalid input data")
+
+
+if __name__ == '__main__':
+    unittest.main()
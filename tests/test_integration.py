@@ -1,7 +1,16 @@
 import unittest
 import json
+import logging
+import queue
+import time
+from unittest import mock
 from app import app
-from app.utils import validate_email, sanitize_string, generate_id, log_operation
+from app import utils
+from app.sketches import worker_name
+from app.codecs import PayloadTooComplex, check_json_limits
+from app.schemas import compile_schema
+from app.utils import (validate_email, sanitize_string, generate_id, log_operation,
+                       DroppingQueueHandler, JsonFormatter)
 
 class TestIntegration(unittest.TestCase):
     def setUp(self):
@@ -64,6 +73,94 @@ class TestIntegration(unittest.TestCase):
                                content_type='application/json')
         self.assertEqual(response.status_code, 400)
 
+    def test_user_lifecycle(self):
+        """Test creating, reading and updating a user over HTTP"""
+        response = self.app.post('/api/v1/users',
+                                 data=json.dumps({"username": "alice", "email": "alice@example.com"}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        user_id = response.get_json()['data']['id']
+
+        response = self.app.put(f'/api/v1/users/{user_id}',
+                                data=json.dumps({"status": "inactive"}),
+                                content_type='application/json')
+        self.assertEqual(response.get_json()['status'], "inactive")
+
+        response = self.app.put(f'/api/v1/users/{user_id}',
+                                data=json.dumps({"status": "on-vacation"}),
+                                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.app.get(f'/api/v1/users/{user_id}')
+        self.assertEqual(response.get_json()['username'], "alice")
+        self.assertEqual(self.app.get('/api/v1/users/unknown').status_code, 404)
+
+    def test_process_async_job(self):
+        """Test async processing returns 202 and a pollable job"""
+        response = self.app.post('/api/v1/process?async=1', data=json.dumps({"a": 1, "b": 2}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        status_url = response.headers['Location']
+        self.assertEqual(status_url, response.get_json()['status_url'])
+
+        for _ in range(500):
+            job = self.app.get(status_url).get_json()
+            if job['status'] == 'done':
+                break
+            time.sleep(0.01)
+        self.assertEqual(job['result']['fields_count'], 2)
+        self.assertIn('job_queue_depth', self.app.get('/api/v1/analytics').get_json())
+        self.assertEqual(self.app.get('/api/v1/process/jobs/unknown').status_code, 404)
+
+    def test_payload_analytics(self):
+        """Test processed payloads show up in the payload statistics"""
+        for i in range(3):
+            self.app.post('/api/v1/process', data=json.dumps({"stats_probe": "yes", "i": i}),
+                          content_type='application/json')
+        summary = self.app.get('/api/v1/analytics/payloads?top=64').get_json()
+        self.assertIn({'item': 'stats_probe=yes', 'count': 3, 'error': 0}, summary['top_values'])
+        self.assertGreaterEqual(summary['payloads'], 3)
+        self.assertEqual(summary['workers'], [worker_name()])
+        sketch = self.app.get('/api/v1/analytics/payloads?format=sketch').get_json()
+        self.assertIn('registers', sketch['distinct_fields'])
+        self.assertEqual(sketch['workers'], [worker_name()])
+
+    def test_payload_too_deep(self):
+        """Test deeply nested payloads are rejected before parsing"""
+        body = '{"a":' * 100 + '1' + '}' * 100
+        response = self.app.post('/api/v1/process', data=body,
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+
+    def test_payload_too_large(self):
+        """Test bodies over MAX_CONTENT_LENGTH are rejected"""
+        body = json.dumps({"blob": "x" * (app.config['MAX_CONTENT_LENGTH'] + 1)})
+        response = self.app.post('/api/v1/process', data=body,
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+
+    def test_create_user_schema_errors(self):
+        """Test user creation reports precise schema errors"""
+        response = self.app.post('/api/v1/users',
+                                 data=json.dumps({"username": 5, "email": "nope", "admin": True}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        details = response.get_json()['details']
+        self.assertIn("'username' must be a string", details)
+        self.assertIn("'email' has an invalid format", details)
+        self.assertIn("'admin' is not allowed", details)
+
+    def test_password_length_bounds(self):
+        """Test password length is validated and the body is optional"""
+        response = self.app.post('/api/v1/security/password')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['length'], 12)
+
+        response = self.app.post('/api/v1/security/password',
+                                 data=json.dumps({"length": 10 ** 9}),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
     def test_metrics_endpoint(self):
         """Test metrics endpoint"""
         response = self.app.get('/metrics')
@@ -72,6 +169,43 @@ class TestIntegration(unittest.TestCase):
         self.assertIn('uptime', data)
         self.assertIn('response_time', data)
 
+class TestSchemas(unittest.TestCase):
+    def test_compile_schema(self):
+        """Test compiled validators"""
+        validate = compile_schema({
+            'name': {'type': str, 'required': True, 'max_length': 3},
+            'count': {'type': int, 'min': 0},
+        })
+        self.assertEqual(validate({'name': 'abc', 'count': 1}), [])
+        self.assertEqual(validate({'count': True}),
+                         ["'name' is required", "'count' must be an integer"])
+        self.assertEqual(validate({'name': 'abcd', 'count': -1}),
+                         ["'name' must have length <= 3", "'count' must be >= 0"])
+        self.assertEqual(validate([]), ["Payload must be a JSON object"])
+
+    def test_check_json_limits(self):
+        """Test raw payload depth and key limits"""
+        check_json_limits(b'{"a": {"b": [1, 2]}, "c": "{{{{:::"}', max_depth=3, max_keys=3)
+        with self.assertRaises(PayloadTooComplex):
+            check_json_limits(b'[[[[1]]]]', max_depth=3, max_keys=10)
+        with self.assertRaises(PayloadTooComplex):
+            check_json_limits(b'{"a": 1, "b": 2, "c\\"": 3}', max_depth=3, max_keys=2)
+
+    def test_unterminated_string_is_rejected_in_linear_time(self):
+        """Test an unclosed string full of escaped quotes cannot pin the CPU"""
+        body = b'"' + b'\\"' * (512 * 1024 - 1)
+        started = time.perf_counter()
+        with self.assertRaises(ValueError):
+            check_json_limits(body, max_depth=32, max_keys=10000)
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+        app.config['TESTING'] = True
+        started = time.perf_counter()
+        response = app.test_client().post('/api/v1/process', data=body,
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertLess(time.perf_counter() - started, 2.0)
+
 class TestUtils(unittest.TestCase):
     def test_validate_email_valid(self):
         """Test email validation with valid email"""
@@ -102,5 +236,52 @@ class TestUtils(unittest.TestCase):
         # This should not raise any exceptions
         log_operation("test_operation", {"test": "data"})
 
+    def test_queue_handler_drops_when_full(self):
+        """Test that a full log queue drops records instead of blocking"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "msg", None, None)
+        for _ in range(3):
+            handler.handle(record)
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(handler.dropped, 2)
+
+    def test_json_formatter(self):
+        """Test structured log output"""
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "hello %s", ("world",), None)
+        record.operation = "test_operation"
+        record.details = {"key": "value"}
+        payload = json.loads(JsonFormatter().format(record))
+        self.assertEqual(payload["message"], "hello world")
+        self.assertEqual(payload["operation"], "test_operation")
+        self.assertEqual(payload["details"], {"key": "value"})
+
+    def test_log_records_are_snapshotted(self):
+        """Test later mutation by the caller does not change a queued record"""
+        handler = DroppingQueueHandler(queue.Queue())
+        utils.logger.addHandler(handler)
+        try:
+            with mock.patch.object(utils.logger, "propagate", False):
+                args = {"step": 1}
+                details = {"step": 1}
+                utils.logger.warning("state %s", args)
+                log_operation("op", details)
+                args["step"] = 2
+                details["step"] = 2
+        finally:
+            utils.logger.removeHandler(handler)
+        message = handler.queue.get_nowait()
+        operation = handler.queue.get_nowait()
+        self.assertEqual(message.getMessage(), "state {'step': 1}")
+        self.assertEqual(operation.details, {"step": 1})
+        self.assertTrue(utils.TextFormatter("%(message)s").format(operation).endswith('{"step": 1}'))
+
+    def test_log_operation_sampling(self):
+        """Test that sampled-out operations are not logged"""
+        with mock.patch.dict(utils._log_sample_rates, {"noisy": 0.0}), \
+                mock.patch.object(utils.logger, "info") as info:
+            log_operation("noisy")
+            log_operation("other")
+        self.assertEqual(info.call_count, 1)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+Tests for the background job queue
+"""
+import threading
+import time
+import unittest
+
+from app.jobs import JobQueue, JobQueueFull
+from app.services import AnalyticsService, process_data_job
+
+
+def _wait_for(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _fail(message):
+    raise ValueError(message)
+
+
+class TestJobQueue(unittest.TestCase):
+    """Test JobQueue on a thread pool"""
+
+    def setUp(self):
+        self.analytics = AnalyticsService()
+        self.queue = JobQueue('thread', workers=1, max_pending=2, result_ttl=60,
+                              listener=self.analytics.record_job)
+
+    def tearDown(self):
+        self.queue.shutdown()
+
+    def test_result_is_pollable(self):
+        job_id = self.queue.submit(sum, [1, 2, 3])
+        job = _wait_for(self.queue, job_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result'], 6)
+        self.assertIn('latency_ms', job)
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_failure_is_reported(self):
+        job = _wait_for(self.queue, self.queue.submit(_fail, "bad payload"))
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['error'], "ValueError: bad payload")
+        self.assertEqual(self.analytics.get_metrics()['jobs']['failed'], 1)
+
+    def test_rejects_beyond_max_pending(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocked():
+            started.set()
+            release.wait()
+
+        first = self.queue.submit(blocked)
+        self.queue.submit(release.wait)
+        with self.assertRaises(JobQueueFull):
+            self.queue.submit(release.wait)
+        self.assertTrue(started.wait(5))
+        self.assertEqual(self.queue.get(first)['status'], 'running')
+        release.set()
+        _wait_for(self.queue, first)
+        jobs = self.analytics.get_metrics()['jobs']
+        self.assertEqual(jobs['submitted'], 2)
+        self.assertEqual(jobs['rejected'], 1)
+
+    def test_results_expire(self):
+        self.queue.result_ttl = 0.05
+        job_id = self.queue.submit(sum, [1])
+        _wait_for(self.queue, job_id)
+        time.sleep(0.1)
+        self.assertIsNone(self.queue.get(job_id))
+        self.assertIsNone(self.queue.get('unknown'))
+
+    def test_oldest_results_dropped_beyond_max_results(self):
+        self.queue.max_results = 2
+        job_ids = [self.queue.submit(sum, [i]) for i in range(2)]
+        for job_id in job_ids:
+            _wait_for(self.queue, job_id)
+        job_ids.append(self.queue.submit(sum, [2]))
+        _wait_for(self.queue, job_ids[-1])
+        self.assertIsNone(self.queue.get(job_ids[0]))
+        self.assertEqual(self.queue.get(job_ids[2])['result'], 2)
+
+    def test_job_ids_are_not_sequential(self):
+        first = self.queue.submit(sum, [1])
+        second = self.queue.submit(sum, [2])
+        self.assertGreaterEqual(len(first), 22)
+        self.assertNotEqual(first[:-4], second[:-4])
+
+    def test_process_pool(self):
+        queue = JobQueue('process', workers=1)
+        try:
+            job = _wait_for(queue, queue.submit(process_data_job, {"a": 1}), timeout=30)
+        finally:
+            queue.shutdown()
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result']['fields_count'], 1)
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            JobQueue('fiber')
+
+
+if __name__ == '__main__':
+    unittest.main()
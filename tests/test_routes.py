@@ -6,8 +6,19 @@ import json
 # Add parent directory to path for import
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from sqlalchemy import create_engine
+
 from app import app, db
 from app.models import Menu
+from app.concurrency import ConcurrencyLimiter, SingleFlightTimeout
+from app.replicas import replica_router
+from app import routes
+from app.config import Config
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 TEST_DB = os.path.join(BASE_DIR, 'test.db')
@@ -55,5 +66,237 @@ class BasicTests(unittest.TestCase):
         self.assertTrue('today_special' in body)
         self.assertEqual(body['today_special'], test_name)
 
+    def test_menu_lookup_timeout_is_unavailable(self):
+        with mock.patch.object(routes.menu_service, 'today_special',
+                               side_effect=SingleFlightTimeout("still running")):
+            response = self.app.get('/menu')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], str(Config.RETRY_AFTER))
+
+    def _add_menus(self, *names):
+        with app.app_context():
+            for name in names:
+                db.session.add(Menu(name=name))
+            db.session.commit()
+
+    def test_menu_list_keyset_pages(self):
+        self._add_menus(*["dish {}".format(i) for i in range(5)])
+        response = self.app.get('/api/v1/menu?limit=2')
+        self.assertEqual(response.status_code, 200)
+        page = response.get_json()
+        self.assertEqual([item['name'] for item in page['items']], ["dish 0", "dish 1"])
+
+        seen = [item['name'] for item in page['items']]
+        while page['next_after'] is not None:
+            page = self.app.get('/api/v1/menu?limit=2&after={}'.format(page['next_after'])).get_json()
+            seen.extend(item['name'] for item in page['items'])
+        self.assertEqual(seen, ["dish {}".format(i) for i in range(5)])
+
+    def test_menu_export_json(self):
+        self._add_menus("Baked potatoes", "Grilled chicken")
+        response = self.app.get('/api/v1/menu/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/json')
+        body = json.loads(response.data)
+        self.assertEqual([item['name'] for item in body], ["Baked potatoes", "Grilled chicken"])
+
+    def test_menu_export_ndjson(self):
+        self._add_menus("Baked potatoes", "Grilled chicken")
+        response = self.app.get('/api/v1/menu/export?format=ndjson')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.data.decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines],
+                         ["Baked potatoes", "Grilled chicken"])
+
+    def test_menu_export_empty(self):
+        response = self.app.get('/api/v1/menu/export')
+        self.assertEqual(json.loads(response.data), [])
+        self.assertEqual(self.app.get('/api/v1/menu/export?format=xml').status_code, 400)
+
+    def test_menu_search_fulltext(self):
+        self._add_menus("Baked potatoes", "Grilled chicken", "Baked salmon")
+        response = self.app.get('/api/v1/menu/search?q=baked')
+        self.assertEqual(response.status_code, 200)
+        names = sorted(r['name'] for r in response.get_json()['results'])
+        self.assertEqual(names, ["Baked potatoes", "Baked salmon"])
+
+        response = self.app.get('/api/v1/menu/search?q=baked salmon')
+        results = response.get_json()['results']
+        self.assertEqual([r['name'] for r in results], ["Baked salmon"])
+
+    def test_menu_search_ranks_closer_matches_first(self):
+        self._add_menus("Baked salmon with a long list of sides", "Baked salmon")
+        results = self.app.get('/api/v1/menu/search?q=salmon').get_json()['results']
+        self.assertEqual([r['name'] for r in results][0], "Baked salmon")
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+    def test_menu_search_ranks_the_newest_matches(self):
+        self._add_menus("Baked salmon", "Baked salmon and rice", "Baked salmon with a long list of sides")
+        with mock.patch.object(routes.menu_search_service, 'RANK_CANDIDATES', 2):
+            results = self.app.get('/api/v1/menu/search?q=salmon').get_json()['results']
+        self.assertEqual([r['name'] for r in results],
+                         ["Baked salmon and rice", "Baked salmon with a long list of sides"])
+
+    def test_menu_search_prefix(self):
+        self._add_menus("Baked potatoes", "Grilled chicken")
+        response = self.app.get('/api/v1/menu/search?q=gril&mode=prefix')
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual([r['name'] for r in results], ["Grilled chicken"])
+
+        response = self.app.get('/api/v1/menu/search?q=gril')
+        self.assertEqual(response.get_json()['results'], [])
+
+    def test_menu_search_tracks_updates_and_deletes(self):
+        self._add_menus("Baked potatoes")
+        with app.app_context():
+            menu = Menu.query.first()
+            menu.name = "Smoked ribs"
+            db.session.commit()
+        self.assertEqual(self.app.get('/api/v1/menu/search?q=baked').get_json()['results'], [])
+        self.assertEqual(len(self.app.get('/api/v1/menu/search?q=ribs').get_json()['results']), 1)
+
+        with app.app_context():
+            db.session.delete(Menu.query.first())
+            db.session.commit()
+        self.assertEqual(self.app.get('/api/v1/menu/search?q=ribs').get_json()['results'], [])
+
+    def test_menu_search_ignores_query_syntax(self):
+        self._add_menus("Baked potatoes")
+        response = self.app.get('/api/v1/menu/search?q=baked" OR NEAR(*')
+        self.assertEqual(response.status_code, 200)
+
+    def test_menu_search_requires_query(self):
+        self.assertEqual(self.app.get('/api/v1/menu/search').status_code, 400)
+        self.assertEqual(self.app.get('/api/v1/menu/search?q=x&mode=fuzzy').status_code, 400)
+
+class ReplicaRoutingTests(unittest.TestCase):
+    """Primary and replica are two SQLite files holding different rows"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.directory = tempfile.mkdtemp()
+        self.replicas = {}
+        for name in ('replica_a', 'replica_b'):
+            engine = create_engine('sqlite:///' + os.path.join(self.directory, name + '.db'))
+            Menu.__table__.create(engine)
+            with engine.begin() as connection:
+                connection.execute(Menu.__table__.insert(), [{"name": "from " + name}])
+            self.replicas[name] = engine
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.add(Menu(name="from primary"))
+            db.session.commit()
+
+    def tearDown(self):
+        replica_router.configure({})
+        for engine in self.replicas.values():
+            engine.dispose()
+        shutil.rmtree(self.directory)
+        with app.app_context():
+            db.drop_all()
+
+    def test_reads_go_to_replicas_round_robin(self):
+        replica_router.configure(self.replicas)
+        names = {self.app.get('/menu').get_json()['today_special'] for _ in range(4)}
+        self.assertEqual(names, {"from replica_a", "from replica_b"})
+
+    def test_no_replicas_reads_primary(self):
+        self.assertEqual(self.app.get('/menu').get_json()['today_special'], "from primary")
+
+    def test_read_your_writes_within_session(self):
+        replica_router.configure(self.replicas)
+        with app.app_context():
+            self.assertTrue(Menu.query.first().name.startswith("from replica"))
+            db.session.add(Menu(name="new dish"))
+            db.session.flush()
+            names = [menu.name for menu in Menu.query.order_by(Menu.id)]
+            self.assertEqual(names, ["from primary", "new dish"])
+            db.session.rollback()
+
+    def test_least_latency_prefers_fastest(self):
+        replica_router.configure(self.replicas, strategy='least_latency')
+        replica_router.latency.update({'replica_a': 0.5, 'replica_b': 0.001})
+        self.assertEqual(self.app.get('/menu').get_json()['today_special'], "from replica_b")
+
+    def test_least_latency_retries_slow_replica(self):
+        replica_router.configure(self.replicas, strategy='least_latency')
+        replica_router.latency.update({'replica_a': 0.5, 'replica_b': 0.001})
+        # one slow statement long ago no longer outweighs recent fast ones
+        replica_router.sampled_at['replica_a'] -= 20 * replica_router.LATENCY_HALF_LIFE
+        self.assertEqual(self.app.get('/menu').get_json()['today_special'], "from replica_a")
+        self.assertLess(replica_router.latency['replica_a'], 0.5)
+
+class AdmissionControlTests(unittest.TestCase):
+    """A 1-slot, no-queue limiter whose slot the test holds"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.original_limiter = routes.admission_limiter
+        self.original_readiness = routes.readiness_service
+        routes.admission_limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=0)
+        routes.readiness_service = routes.ReadinessService(db_check_ttl=60)
+
+    def tearDown(self):
+        routes.admission_limiter = self.original_limiter
+        routes.readiness_service = self.original_readiness
+
+    def test_requests_release_their_slot(self):
+        for _ in range(3):
+            self.assertEqual(self.app.get('/').status_code, 200)
+        self.assertEqual(routes.admission_limiter.active, 0)
+
+    def test_overload_sheds_with_retry_after(self):
+        routes.admission_limiter.acquire()
+        response = self.app.get('/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], str(Config.RETRY_AFTER))
+        self.assertEqual(routes.admission_limiter.rejected, 1)
+
+    def test_priority_lane_bypasses_limiter(self):
+        routes.admission_limiter.acquire()
+        self.assertEqual(self.app.get('/health').status_code, 200)
+        metrics = self.app.get('/metrics').get_json()
+        self.assertEqual(metrics['admission']['active'], 1)
+
+    def test_expired_deadline_is_rejected_without_waiting(self):
+        routes.admission_limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=10)
+        routes.admission_limiter.acquire()
+        stale = str(int((time.time() - Config.REQUEST_DEADLINE - 1) * 1000))
+        started = time.monotonic()
+        response = self.app.get('/', headers={'X-Request-Start': stale})
+        self.assertEqual(response.status_code, 503)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_future_request_start_does_not_extend_deadline(self):
+        routes.admission_limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=10)
+        routes.admission_limiter.acquire()
+        future = str(int((time.time() + 3600) * 1000))
+        original_deadline = Config.REQUEST_DEADLINE
+        Config.REQUEST_DEADLINE = 0.1
+        try:
+            started = time.monotonic()
+            response = self.app.get('/', headers={'X-Request-Start': future})
+        finally:
+            Config.REQUEST_DEADLINE = original_deadline
+        self.assertEqual(response.status_code, 503)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_readiness_follows_limiter(self):
+        self.assertEqual(self.app.get('/ready').get_json()['status'], "ready")
+        routes.admission_limiter.acquire()
+        response = self.app.get('/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.get_json()['overloaded'])
+
+    def test_readiness_caches_database_check(self):
+        with app.app_context():
+            first = routes.readiness_service.check_database()
+            self.assertTrue(first['ok'])
+            self.assertIs(routes.readiness_service.check_database(), first)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from app import app, db
+from app.models import Menu
+from seed import Seeder, synthetic_menu_name
+
+
+class SeederTests(unittest.TestCase):
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.seeder = Seeder()
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+    def tearDown(self):
+        with app.app_context():
+            db.drop_all()
+
+    def test_populate_database_default(self):
+        with app.app_context():
+            self.seeder.populate_database()
+            self.seeder.populate_database()
+            self.assertEqual(Menu.query.count(), 1)
+            self.assertEqual(Menu.query.first().name, "Baked potatoes")
+
+    def test_synthetic_names_are_deterministic(self):
+        self.assertEqual(synthetic_menu_name(7, 123), synthetic_menu_name(7, 123))
+        self.assertNotEqual(synthetic_menu_name(7, 123), synthetic_menu_name(8, 123))
+
+    def test_populate_menu_resumes(self):
+        with app.app_context():
+            self.assertEqual(self.seeder.populate_menu(250, seed=3, chunk_size=100), 250)
+            self.assertEqual(self.seeder.populate_menu(600, seed=3, chunk_size=100), 350)
+            self.assertEqual(self.seeder.populate_menu(600, seed=3, chunk_size=100), 0)
+            names = [menu.name for menu in Menu.query.order_by(Menu.id)]
+
+        expected = [synthetic_menu_name(3, index) for index in range(600)]
+        self.assertEqual(names, expected)
+
+    def test_populate_menu_ignores_other_rows(self):
+        with app.app_context():
+            self.seeder.populate_database()
+            self.assertEqual(self.seeder.populate_menu(50, seed=1, chunk_size=20), 50)
+            # deleting a synthetic row must not make the next run repeat indices
+            db.session.delete(Menu.query.filter_by(name=synthetic_menu_name(1, 10)).one())
+            db.session.commit()
+            self.assertEqual(self.seeder.populate_menu(60, seed=1, chunk_size=20), 10)
+            names = [menu.name for menu in Menu.query.order_by(Menu.id)]
+            with self.assertRaises(ValueError):
+                self.seeder.populate_menu(70, seed=2)
+
+        self.assertEqual(names[0], "Baked potatoes")
+        self.assertEqual(names[1], synthetic_menu_name(1, 0))
+        self.assertEqual(names[-1], synthetic_menu_name(1, 59))
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_populate_menu_reports_progress(self):
+        calls = []
+        with app.app_context():
+            self.seeder.populate_menu(25, chunk_size=10,
+                                      progress=lambda done, total: calls.append(done))
+        self.assertEqual(calls, [10, 20, 25])
+
+
+if __name__ == "__main__":
+    unittest.main()
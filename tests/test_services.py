@@ -1,9 +1,18 @@
 """
 Tests for business logic services
 """
+import gc
+import os
 import unittest
 import json
+import threading
+import time
+import weakref
 from app.services import UserService, DataService, SecurityService, AnalyticsService
+from app.concurrency import ConcurrencyLimiter, SingleFlight, SingleFlightTimeout, single_flight
+from app.records import UserRecord, pack_user, status_code
+from app.storage import ShardedStore
+from app.utils import IdGenerator
 
 
 class TestUserService(unittest.TestCase):
@@ -55,6 +64,24 @@ class TestUserService(unittest.TestCase):
         result = self.user_service.update_user("nonexistent", username="newuser")
         self.assertIsNone(result)
     
+    def test_update_user_copies_on_write(self):
+        """Test updates replace the record instead of mutating it"""
+        user = self.user_service.create_user("testuser", "test@example.com")
+        updated = self.user_service.update_user(user['id'], username="newuser")
+        
+        self.assertEqual(user['username'], "testuser")
+        self.assertEqual(self.user_service.get_user(user['id']), updated)
+    
+    def test_compare_and_set_user(self):
+        """Test conditional update only applies to the record that was read"""
+        user = self.user_service.create_user("testuser", "test@example.com")
+        first = self.user_service.compare_and_set_user(user['id'], user, status="inactive")
+        second = self.user_service.compare_and_set_user(user['id'], user, status="suspended")
+        
+        self.assertEqual(first['status'], "inactive")
+        self.assertIsNone(second)
+        self.assertEqual(self.user_service.get_user(user['id'])['status'], "inactive")
+    
     def test_delete_user_success(self):
         """Test successful user deletion"""
         user = self.user_service.create_user("testuser", "test@example.com")
@@ -69,6 +96,176 @@ class TestUserService(unittest.TestCase):
         self.assertFalse(success)
 
 
+class TestIdGenerator(unittest.TestCase):
+    """Test IdGenerator uniqueness and ordering"""
+
+    def test_generators_can_be_collected(self):
+        """Test the fork hook does not keep generators alive"""
+        generator = IdGenerator()
+        ref = weakref.ref(generator)
+        del generator
+        gc.collect()
+        self.assertIsNone(ref())
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs fork")
+    def test_forked_child_gets_new_worker_id(self):
+        """Test a forked child resets the generators it inherited"""
+        generator = IdGenerator()
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write_end, str(generator.worker_id).encode())
+            os._exit(0)
+        os.close(write_end)
+        child_worker_id = int(os.read(read_end, 32))
+        os.close(read_end)
+        os.waitpid(pid, 0)
+        self.assertNotEqual(child_worker_id, generator.worker_id)
+
+    def test_ids_are_sorted_within_a_thread(self):
+        """Test IDs from one thread are strictly increasing"""
+        generator = IdGenerator()
+        ids = [generator.next_id() for _ in range(10000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertTrue(all(len(id_value) == 32 for id_value in ids))
+
+    def test_ids_unique_across_threads(self):
+        """Stress test: many threads generating IDs never collide"""
+        generator = IdGenerator()
+        results = [[] for _ in range(8)]
+
+        def worker(out):
+            for _ in range(25000):
+                out.append(generator.next_id())
+
+        threads = [threading.Thread(target=worker, args=(out,)) for out in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        all_ids = [id_value for out in results for id_value in out]
+        self.assertEqual(len(set(all_ids)), 200000)
+        for out in results:
+            self.assertEqual(out, sorted(out))
+
+    def test_worker_id_separates_generators(self):
+        """Test generators with different worker ids never collide"""
+        first, second = IdGenerator(worker_id=1), IdGenerator(worker_id=2)
+        ids = {first.next_id() for _ in range(1000)} | {second.next_id() for _ in range(1000)}
+        self.assertEqual(len(ids), 2000)
+
+    def test_host_id_in_worker_id(self):
+        """Test a configured host id takes the worker id's high byte"""
+        first, second = IdGenerator(host_id=1), IdGenerator(host_id=2)
+        self.assertEqual(first.worker_id >> 16, 1)
+        self.assertEqual(second.worker_id >> 16, 2)
+        self.assertEqual(first.worker_id & 0xFFFF, second.worker_id & 0xFFFF)
+
+    def test_shared_worker_id_starts_apart(self):
+        """Test generators sharing a worker id start at different sequences"""
+        first, second = IdGenerator(worker_id=7), IdGenerator(worker_id=7)
+        self.assertNotEqual(first.next_int() & IdGenerator.SEQUENCE_MASK,
+                            second.next_int() & IdGenerator.SEQUENCE_MASK)
+
+    def test_user_ids_do_not_overwrite(self):
+        """Test creating many users never overwrites an existing one"""
+        user_service = UserService()
+        for i in range(20000):
+            user_service.create_user(f"user{i}", f"user{i}@example.com")
+        self.assertEqual(len(user_service.users), 20000)
+
+
+class TestUserRecord(unittest.TestCase):
+    """Test the packed user representation"""
+
+    def test_round_trip(self):
+        """Test packing and decoding all fields"""
+        user_id = 1700000000000 << IdGenerator.TIMESTAMP_SHIFT | 255
+        record = UserRecord(user_id, pack_user("zoë", "zoe@example.com"))
+        user = record.to_dict()
+        
+        self.assertEqual(user['id'], "018bcfe56800000000000000000000ff")
+        self.assertEqual(record.created_at_ms, 1700000000000)
+        self.assertEqual(user['username'], "zoë")
+        self.assertEqual(user['email'], "zoe@example.com")
+        self.assertEqual(user['status'], "active")
+        self.assertNotIn('updated_at', user)
+        self.assertEqual(dict(record), user)
+
+    def test_replace_is_copy_on_write(self):
+        """Test replace returns a new packed record with extra fields kept"""
+        data = pack_user("user", "user@example.com")
+        updated = UserRecord(1, UserRecord(1, data).replace(1700000001000, status="suspended", nickname="u"))
+        
+        self.assertEqual(UserRecord(1, data)['status'], "active")
+        self.assertEqual(updated['status'], "suspended")
+        self.assertEqual(updated['nickname'], "u")
+        self.assertIn('updated_at', updated)
+
+    def test_status_codes_are_interned(self):
+        """Test statuses map to fixed one-byte codes and unknown ones are refused"""
+        self.assertEqual(status_code("active"), 0)
+        self.assertEqual(status_code("deleted"), 3)
+        with self.assertRaises(ValueError):
+            status_code("on-vacation")
+
+
+class TestShardedStore(unittest.TestCase):
+    """Test ShardedStore concurrency guarantees"""
+
+    def test_basic_operations(self):
+        """Test put/get/delete/insert_if_absent"""
+        store = ShardedStore(shards=4)
+        self.assertTrue(store.insert_if_absent("a", 1))
+        self.assertFalse(store.insert_if_absent("a", 2))
+        store.put("b", 3)
+        self.assertEqual(store.get("a"), 1)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(sorted(store.values()), [1, 3])
+        self.assertTrue(store.delete("a"))
+        self.assertFalse(store.delete("a"))
+        self.assertNotIn("a", store)
+
+    def test_compare_and_set_missing_key(self):
+        """Test CAS never creates a key"""
+        store = ShardedStore()
+        self.assertFalse(store.compare_and_set("missing", None, 1))
+        self.assertNotIn("missing", store)
+
+    def test_concurrent_updates_are_not_lost(self):
+        """Test read-modify-write from many threads loses no increments"""
+        store = ShardedStore(shards=4)
+        for key in range(4):
+            store.put(key, 0)
+
+        def worker():
+            for i in range(2000):
+                store.update(i % 4, lambda value: value + 1)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([store.get(key) for key in range(4)], [4000] * 4)
+
+    def test_items_after_pages_in_key_order(self):
+        """Test keyset pages come from the sorted index and skip deleted keys"""
+        store = ShardedStore(shards=4)
+        for key in [7, 3, 9, 1, 5, 8]:
+            store.put(key, key * 10)
+        store.put(3, 31)
+        store.delete(5)
+        self.assertEqual(store.items_after(None, 3), [(1, 10), (3, 31), (7, 70)])
+        self.assertEqual(store.items_after(7, 3), [(8, 80), (9, 90)])
+        self.assertEqual(store.items_after(2, 1), [(3, 31)])
+        store.clear()
+        self.assertEqual(store.items_after(None, 3), [])
+
+
 class TestDataService(unittest.TestCase):
     """Test DataService functionality"""
     
@@ -115,6 +312,127 @@ class TestDataService(unittest.TestCase):
         self.assertIsNone(cached)
 
 
+class TestSingleFlight(unittest.TestCase):
+    """Test request coalescing"""
+
+    def _run_concurrently(self, target, count=8):
+        results = [None] * count
+
+        def worker(index):
+            try:
+                results[index] = target()
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_callers_share_one_call(self):
+        """Test duplicates wait for the leader and share its result"""
+        group = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return object()
+
+        results = self._run_concurrently(lambda: group.do('key', slow))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(group.coalesced, 7)
+        self.assertEqual(group.in_flight(), 0)
+
+    def test_errors_propagate_to_all_callers(self):
+        """Test the leader's exception reaches every waiting caller"""
+        group = SingleFlight()
+
+        def failing():
+            time.sleep(0.2)
+            raise ValueError("boom")
+
+        results = self._run_concurrently(lambda: group.do('key', failing))
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    def test_duplicate_timeout(self):
+        """Test duplicates stop waiting after the timeout"""
+        group = SingleFlight()
+        leader = threading.Thread(target=group.do, args=('key', time.sleep, (0.5,)))
+        leader.start()
+        time.sleep(0.05)
+        with self.assertRaises(SingleFlightTimeout):
+            group.do('key', time.sleep, (0.5,), timeout=0.05)
+        leader.join()
+
+    def test_decorator_on_method(self):
+        """Test the decorator coalesces method calls by key"""
+        class Service:
+            calls = 0
+
+            @single_flight(key=lambda self, name: name)
+            def load(self, name):
+                Service.calls += 1
+                time.sleep(0.2)
+                return name.upper()
+
+        service = Service()
+        results = self._run_concurrently(lambda: service.load("menu"))
+        self.assertEqual(results, ["MENU"] * 8)
+        self.assertEqual(Service.calls, 1)
+
+    def test_process_data_coalesces_identical_payloads(self):
+        """Test identical concurrent payloads are processed once"""
+        data_service = DataService()
+        process = data_service._process
+        calls = []
+
+        def slow_process(*args):
+            calls.append(1)
+            # keep the leader busy so every other thread arrives as a duplicate
+            time.sleep(0.2)
+            return process(*args)
+
+        data_service._process = slow_process
+        payload = {"b": 1, "a": [1, 2, 3]}
+        results = self._run_concurrently(lambda: data_service.process_data(dict(payload)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(data_service._in_flight.coalesced, 7)
+        self.assertEqual(len({result['checksum'] for result in results}), 1)
+        self.assertEqual(results[0]['size'], len(json.dumps(payload)))
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+    """Test bounded concurrency and queueing"""
+
+    def test_rejects_when_queue_full(self):
+        limiter = ConcurrencyLimiter(max_concurrent=2, max_queue=0)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=1))
+        self.assertTrue(limiter.saturated())
+        self.assertEqual(limiter.rejected, 1)
+        limiter.release()
+        self.assertTrue(limiter.acquire())
+
+    def test_waiter_gets_released_slot(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1)
+        limiter.acquire()
+        threading.Timer(0.05, limiter.release).start()
+        self.assertTrue(limiter.acquire(timeout=2))
+        self.assertEqual(limiter.stats()['active'], 1)
+
+    def test_wait_times_out(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1)
+        limiter.acquire()
+        self.assertFalse(limiter.acquire(timeout=0.05))
+        self.assertEqual(limiter.timed_out, 1)
+        self.assertEqual(limiter.waiting, 0)
+
+
 class TestSecurityService(unittest.TestCase):
     """Test SecurityService functionality"""
     
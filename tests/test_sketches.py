@@ -0,0 +1,166 @@
+"""
+Tests for streaming sketches and payload statistics
+"""
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+
+from app.sketches import HyperLogLog, PayloadStats, QuantileSketch, SharedPayloadStats, SpaceSaving
+
+
+class TestHyperLogLog(unittest.TestCase):
+    """Test distinct counting"""
+
+    def test_estimate_within_error(self):
+        sketch = HyperLogLog()
+        for i in range(50000):
+            sketch.add(f'key-{i}')
+            sketch.add(f'key-{i}')
+        self.assertAlmostEqual(sketch.count(), 50000, delta=50000 * 0.05)
+
+    def test_small_counts_are_exact_enough(self):
+        sketch = HyperLogLog()
+        for name in ('a', 'b', 'c'):
+            sketch.add(name)
+        self.assertEqual(sketch.count(), 3)
+
+    def test_merge_equals_union(self):
+        left, right = HyperLogLog(), HyperLogLog()
+        for i in range(20000):
+            (left if i % 2 else right).add(str(i))
+            left.add(str(i % 100))
+        left.merge(HyperLogLog.from_dict(right.to_dict()))
+        self.assertAlmostEqual(left.count(), 20000, delta=20000 * 0.05)
+
+
+class TestSpaceSaving(unittest.TestCase):
+    """Test heavy hitters"""
+
+    def test_finds_heavy_hitters(self):
+        sketch = SpaceSaving(capacity=10)
+        rng = random.Random(1)
+        for _ in range(20000):
+            sketch.add('hot' if rng.random() < 0.3 else 'warm' if rng.random() < 0.2 else rng.random())
+        top = sketch.top(2)
+        self.assertEqual([entry['item'] for entry in top], ['hot', 'warm'])
+        self.assertLessEqual(top[0]['count'] - top[0]['error'], 20000)
+        self.assertEqual(len(sketch.counters), 10)
+
+    def test_merge_keeps_capacity_and_totals(self):
+        left, right = SpaceSaving(capacity=3), SpaceSaving(capacity=3)
+        for item in 'aaab':
+            left.add(item)
+        for item in 'aacd':
+            right.add(item)
+        left.merge(SpaceSaving.from_dict(right.to_dict()))
+        self.assertEqual(left.top(1)[0], {'item': 'a', 'count': 5, 'error': 0})
+        self.assertEqual(len(left.counters), 3)
+
+
+class TestQuantileSketch(unittest.TestCase):
+    """Test relative-error quantiles"""
+
+    def test_quantiles_within_relative_accuracy(self):
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        values = list(range(1, 10001))
+        random.Random(2).shuffle(values)
+        for value in values:
+            sketch.add(value)
+        for q in (0.5, 0.9, 0.99):
+            expected = 1 + q * 9999
+            self.assertAlmostEqual(sketch.quantile(q), expected, delta=expected * 0.02)
+        self.assertEqual(sketch.quantile(0), 1)
+        self.assertEqual(sketch.quantile(1), 10000)
+
+    def test_memory_is_bounded(self):
+        sketch = QuantileSketch(max_buckets=50)
+        for exponent in range(200):
+            sketch.add(1.1 ** exponent)
+        self.assertLessEqual(len(sketch.buckets), 50)
+        self.assertEqual(sketch.count, 200)
+
+    def test_merge(self):
+        left, right = QuantileSketch(), QuantileSketch()
+        for value in range(1000):
+            (left if value % 2 else right).add(value)
+        left.merge(QuantileSketch.from_dict(right.to_dict()))
+        self.assertEqual(left.count, 1000)
+        self.assertEqual(left.min, 0)
+        self.assertAlmostEqual(left.quantile(0.5), 500, delta=10)
+
+
+class TestPayloadStats(unittest.TestCase):
+    """Test the combined payload statistics"""
+
+    @staticmethod
+    def _observe(stats, payload):
+        body = json.dumps(payload, sort_keys=True)
+        stats.observe(payload, len(body), hashlib.sha256(body.encode()).hexdigest())
+
+    def test_summary(self):
+        stats = PayloadStats(top_k=8)
+        for i in range(100):
+            self._observe(stats, {"kind": "order", "id": i % 10, "items": [1, 2]})
+        summary = stats.summary(top=3)
+        self.assertEqual(summary['payloads'], 100)
+        self.assertEqual(summary['distinct_payloads'], 10)
+        self.assertEqual(summary['distinct_fields'], 3)
+        self.assertEqual(summary['top_values'][0], {'item': 'kind=order', 'count': 100, 'error': 0})
+        self.assertNotIn('items=[1, 2]', [entry['item'] for entry in stats.top_values.top(8)])
+        self.assertIsNotNone(summary['size']['p50'])
+
+    def test_merge_across_workers(self):
+        workers = [PayloadStats(), PayloadStats()]
+        for i in range(40):
+            self._observe(workers[i % 2], {"n": i})
+        merged = PayloadStats.from_dict(json.loads(json.dumps(workers[0].to_dict())))
+        merged.merge(PayloadStats.from_dict(json.loads(json.dumps(workers[1].to_dict()))))
+        summary = merged.summary()
+        self.assertEqual(summary['payloads'], 40)
+        self.assertEqual(summary['distinct_payloads'], 40)
+        self.assertEqual(summary['top_fields'][0]['count'], 40)
+
+
+class TestSharedPayloadStats(unittest.TestCase):
+    """Test merging workers' statistics through a shared file"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'stats.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_merges_published_workers(self):
+        workers = []
+        for name in ('host:1', 'host:2'):
+            stats = PayloadStats()
+            workers.append((stats, SharedPayloadStats(self.path, worker=name)))
+        for i in range(40):
+            TestPayloadStats._observe(workers[i % 2][0], {"n": i})
+        for stats, shared in workers:
+            shared.publish(stats, force=True)
+
+        merged, names = workers[0][1].merged()
+        self.assertEqual(names, ['host:1', 'host:2'])
+        self.assertEqual(merged.summary()['payloads'], 40)
+
+    def test_publish_is_flushed_in_the_background(self):
+        stats = PayloadStats()
+        shared = SharedPayloadStats(self.path, interval=0.05, worker='host:1')
+        TestPayloadStats._observe(stats, {"n": 1})
+        shared.publish(stats)
+        self.assertEqual(shared.merged()[1], [])
+        deadline = time.monotonic() + 5
+        while not shared.merged()[1] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(shared.merged()[0].payloads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
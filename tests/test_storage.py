@@ -0,0 +1,247 @@
+"""
+Tests for storage backends and consistent-hash sharding
+"""
+import gc
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import weakref
+
+from app.records import USER_STATUSES
+from app.services import UserService
+from app.storage import ConsistentHashStore, HashRing, KeyValueStore, RingState, SQLiteStore, ShardedStore
+
+
+class TestKeyValueStore(unittest.TestCase):
+    """Test the backend interface"""
+
+    def test_incomplete_backend_cannot_be_created(self):
+        """Test a backend missing an operation fails at construction"""
+        class GetOnly(KeyValueStore):
+            def get(self, key, default=None):
+                return default
+
+        with self.assertRaises(TypeError):
+            GetOnly()
+
+
+class TestSQLiteStore(unittest.TestCase):
+    """Test SQLiteStore against a temporary file"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = SQLiteStore(os.path.join(self.directory, 'users.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_operations(self):
+        """Test basic operations and conditional writes"""
+        self.assertTrue(self.store.insert_if_absent(1, b'a'))
+        self.assertFalse(self.store.insert_if_absent(1, b'b'))
+        self.assertTrue(self.store.compare_and_set(1, b'a', b'c'))
+        self.assertFalse(self.store.compare_and_set(1, b'a', b'd'))
+        self.assertEqual(self.store.update(1, lambda value: value + b'!'), b'c!')
+        self.assertEqual(self.store.get(1), b'c!')
+        self.assertTrue(self.store.delete(1))
+        self.assertIsNone(self.store.get(1))
+
+    def test_stores_can_be_collected(self):
+        """Test the fork hook does not keep stores alive"""
+        ref = weakref.ref(SQLiteStore(os.path.join(self.directory, 'other.db')))
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_items_after_is_numeric_order(self):
+        """Test 128-bit keys come back in numeric order"""
+        keys = [5, 1 << 100, 3, (1 << 127) + 1, 256]
+        for key in keys:
+            self.store.put(key, b'x')
+        self.assertEqual([key for key, _ in self.store.items_after(None, 10)], sorted(keys))
+        self.assertEqual([key for key, _ in self.store.items_after(5, 2)], [256, 1 << 100])
+
+
+class TestConsistentHashStore(unittest.TestCase):
+    """Test sharding users across several SQLite files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = ConsistentHashStore({
+            name: SQLiteStore(os.path.join(self.directory, name + '.db'))
+            for name in ('shard0', 'shard1', 'shard2')
+        })
+        self.user_service = UserService(store=self.store)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ring_is_stable(self):
+        """Test adding a node only moves keys to that node"""
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b', 'c', 'd'])
+        for key in range(1000):
+            if before.node_for(key) != after.node_for(key):
+                self.assertEqual(after.node_for(key), 'd')
+
+    def test_users_spread_across_shards(self):
+        """Test users land on several shards and can be read back"""
+        users = [self.user_service.create_user(f"user{i}", f"user{i}@example.com") for i in range(300)]
+        self.assertTrue(all(len(store) > 0 for store in self.store.backends.values()))
+        self.assertEqual(len(self.store), 300)
+        for user in users[::25]:
+            self.assertEqual(self.user_service.get_user(user['id'])['username'], user['username'])
+
+    def test_list_users_scatter_gather(self):
+        """Test paging through users merges shards in creation order"""
+        created = [self.user_service.create_user(f"user{i}", f"user{i}@example.com")['id']
+                   for i in range(120)]
+        listed = []
+        page = self.user_service.list_users(limit=50)
+        listed.extend(user['id'] for user in page['items'])
+        while page['next_after']:
+            page = self.user_service.list_users(after=page['next_after'], limit=50)
+            listed.extend(user['id'] for user in page['items'])
+        self.assertEqual(listed, created)
+
+    def test_add_backend_rebalances_online(self):
+        """Test adding a shard moves keys while writes continue"""
+        users = [self.user_service.create_user(f"user{i}", f"user{i}@example.com") for i in range(500)]
+        stop = threading.Event()
+        written = []
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                user = users[i % len(users)]
+                updated = self.user_service.update_user(user['id'], status=USER_STATUSES[i % 3])
+                written.append((user['id'], USER_STATUSES[i % 3] if updated is not None else None))
+                i += 1
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        moved = self.store.add_backend('shard3', SQLiteStore(os.path.join(self.directory, 'shard3.db')))
+        stop.set()
+        thread.join()
+
+        self.assertGreater(moved, 0)
+        self.assertEqual(len(self.store), 500)
+        for name, backend in self.store.backends.items():
+            for key, _ in backend.iter_items():
+                self.assertEqual(self.store._rings[0].node_for(key), name)
+        for user in users:
+            self.assertIsNotNone(self.user_service.get_user(user['id']))
+        last_status = dict(written)
+        for user_id, status in last_status.items():
+            self.assertEqual(self.user_service.get_user(user_id)['status'], status)
+
+    def test_in_memory_backends(self):
+        """Test the ring also works over in-memory stores"""
+        store = ConsistentHashStore({'a': ShardedStore(), 'b': ShardedStore()})
+        for key in range(100):
+            store.put(key, key)
+        store.add_backend('c', ShardedStore())
+        self.assertEqual(sorted(store.values()), list(range(100)))
+        self.assertEqual([key for key, _ in store.items_after(10, 3)], [11, 12, 13])
+
+
+class TestSharedRing(unittest.TestCase):
+    """Test two store instances, as in two processes, over the same files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.db')
+
+    def _open(self):
+        backends = {name: SQLiteStore(self._path(name)) for name in ('shard0', 'shard1', 'shard2')}
+        return ConsistentHashStore(backends, ring_state=RingState(self._path('ring')),
+                                   refresh_interval=0)
+
+    def test_worker_follows_rebalance_in_other_store(self):
+        """Test a running store sees a backend another store added"""
+        worker = self._open()
+        user_service = UserService(store=worker)
+        users = [user_service.create_user(f"user{i}", f"user{i}@example.com") for i in range(200)]
+
+        rebalancer = self._open()
+        moved = rebalancer.add_backend('shard3', SQLiteStore(self._path('shard3')))
+        self.assertGreater(moved, 0)
+
+        for user in users:
+            self.assertEqual(user_service.get_user(user['id'])['username'], user['username'])
+        self.assertIn('shard3', worker.backends)
+        created = user_service.create_user("late", "late@example.com")
+        self.assertEqual(worker.backend_for(created.user_id).path,
+                         rebalancer.backend_for(created.user_id).path)
+        self.assertEqual(len(worker), 201)
+
+    def test_previous_owner_checked_until_cleanup(self):
+        """Test a key left on its old owner stays reachable and cleanup moves it"""
+        worker = self._open()
+        for key in range(200):
+            worker.put(key, b'x')
+        rebalancer = self._open()
+        rebalancer.add_backend('shard3', SQLiteStore(self._path('shard3')))
+
+        # a write routed with the old ring after the sweeps
+        straggler = next(key for key in range(200, 1000)
+                         if rebalancer.backend_for(key) is rebalancer.backends['shard3'])
+        old_ring = HashRing(['shard0', 'shard1', 'shard2'])
+        rebalancer.backends[old_ring.node_for(straggler)].put(straggler, b'late')
+        self.assertEqual(worker.get(straggler), b'late')
+
+        self.assertEqual(rebalancer.cleanup(), 1)
+        self.assertEqual(worker.get(straggler), b'late')
+        self.assertIsNone(worker._rings[1])
+        for name, backend in worker.backends.items():
+            for key, _ in backend.iter_items():
+                self.assertEqual(worker._rings[0].node_for(key), name)
+
+    def test_delete_during_move_stays_deleted(self):
+        """Test a delete from another store between a move's read and insert wins"""
+        worker = self._open()
+        for key in range(200):
+            worker.put(key, b'x')
+        rebalancer = self._open()
+        rebalancer._begin_add('shard3', SQLiteStore(self._path('shard3')))
+        worker.get(0)
+        key = next(key for key in range(200) if rebalancer._owners(rebalancer._rings, key)[1])
+        target, source = rebalancer._owners(rebalancer._rings, key)
+        copying = threading.Event()
+
+        def pause(statement):
+            if statement.startswith('INSERT OR IGNORE INTO'):
+                copying.set()
+                time.sleep(0.3)
+
+        def move():
+            connections = [source._conn(), target._conn()]
+            for conn in connections:
+                conn.set_trace_callback(pause)
+            try:
+                rebalancer._move_key(key, source, target)
+            finally:
+                for conn in connections:
+                    conn.set_trace_callback(None)
+
+        mover = threading.Thread(target=move)
+        mover.start()
+        self.assertTrue(copying.wait(5))
+        self.assertTrue(worker.delete(key))
+        mover.join()
+
+        self.assertIsNone(worker.get(key))
+        self.assertIsNone(rebalancer.get(key))
+        for backend in worker.backends.values():
+            self.assertIsNone(backend.get(key))
+
+
+if __name__ == '__main__':
+    unittest.main()